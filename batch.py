@@ -0,0 +1,163 @@
+"""
+Headless batch processing.
+
+Runs a chain of operations over many images and PDFs across a process pool,
+without importing Qt. Example:
+
+    python batch.py scans/ "photos/*.jpg" --op alpha --op invert -o out/
+    python batch.py layers/*.png --composite stacked.png
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from logic import (
+    Layer, to_alpha, invert_color, remove, composite_layers, apply_effects,
+    load_pdf_layers, save_layers_to_pdf
+)
+
+OPS = {
+    "alpha": to_alpha,
+    "invert": invert_color,
+    "rembg": remove,
+}
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+PDF_EXTS = (".pdf",)
+
+# Each rembg worker loads its own model, and onnxruntime already spreads one
+# inference across every core
+REMBG_JOBS = 2
+
+
+def collect_inputs(patterns):
+    """Expands directories and globs into an ordered, de-duplicated file list."""
+    paths, seen = [], set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(os.path.join(pattern, f) for f in os.listdir(pattern))
+        else:
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        for p in matches:
+            if p.lower().endswith(IMAGE_EXTS + PDF_EXTS) and p not in seen:
+                seen.add(p)
+                paths.append(p)
+    return paths
+
+
+def output_paths(paths, out_dir):
+    """Maps each input to an output file, suffixing names that would collide."""
+    taken = set()
+    outs = []
+    for p in paths:
+        stem, ext = os.path.splitext(os.path.basename(p))
+        ext = ".pdf" if ext.lower() in PDF_EXTS else ".png"
+        name, n = stem + ext, 1
+        while name in taken:
+            n += 1
+            name = f"{stem}_{n}{ext}"
+        taken.add(name)
+        outs.append(os.path.join(out_dir, name))
+    return outs
+
+
+def process_file(path, out_path, ops):
+    """Worker entry point. Returns (megapixels processed, seconds taken)."""
+    start = time.perf_counter()
+    chain = [OPS[name] for name in ops]
+
+    if path.lower().endswith(PDF_EXTS):
+        layers = load_pdf_layers(path)
+        for l in layers:
+            if all(hasattr(func, "kernel") for func in chain):
+                # Recorded lazily, then fused into one pass per page as it is exported
+                for func in chain:
+                    l.add_op(func)
+            else:
+                l.img = apply_effects(l.img, chain)
+        save_layers_to_pdf(layers, out_path)
+        pixels = sum(l.size[0] * l.size[1] for l in layers)
+    else:
+        img = apply_effects(Image.open(path), chain)
+        img.save(out_path)
+        pixels = img.width * img.height
+
+    return pixels / 1e6, time.perf_counter() - start
+
+
+def run(paths, out_dir, ops, jobs=None):
+    """Processes every file across a process pool, printing one line per file."""
+    os.makedirs(out_dir, exist_ok=True)
+    outs = output_paths(paths, out_dir)
+    done, failures = {}, {}
+
+    # Forking after rembg has started its native thread pools deadlocks on exit
+    ctx = multiprocessing.get_context("spawn")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+        if "rembg" in ops:
+            jobs = min(jobs, REMBG_JOBS)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+        futures = {pool.submit(process_file, p, o, ops): (p, o) for p, o in zip(paths, outs)}
+        for fut in as_completed(futures):
+            path, out = futures[fut]
+            try:
+                mp, secs = fut.result()
+            except Exception as e:
+                failures[path] = str(e)
+                print(f"FAIL {path}: {e}", file=sys.stderr)
+                continue
+            done[path] = out
+            rate = mp / secs if secs else 0.0
+            print(f"ok   {path} -> {out}  {secs:.2f}s  {mp:.1f} MP  {rate:.1f} MP/s")
+
+    # Keep input order for anything that stacks or concatenates the results
+    return [done[p] for p in paths if p in done], failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-process images and PDFs without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("--op", dest="ops", action="append", default=[], choices=sorted(OPS),
+                        help="operation to apply, repeatable; applied in the order given")
+    parser.add_argument("-o", "--out-dir", default="batch_output", help="directory for processed files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help=f"worker processes (default: all cores, or {REMBG_JOBS} with --op rembg)")
+    parser.add_argument("--composite", metavar="PNG", help="also stack the processed images bottom-up into one file")
+    parser.add_argument("--merge", metavar="PDF", help="also combine every processed page and image into one PDF")
+    args = parser.parse_args(argv)
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("No images or PDFs matched.", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    outs, failures = run(paths, args.out_dir, args.ops, args.jobs)
+
+    if args.composite:
+        layers = [Layer(os.path.basename(o), Image.open(o)) for o in outs if not o.endswith(PDF_EXTS)]
+        if layers:
+            composite_layers(layers).save(args.composite)
+    if args.merge:
+        layers = []
+        for o in outs:
+            if o.endswith(PDF_EXTS):
+                layers.extend(load_pdf_layers(o))
+            else:
+                layers.append(Layer(os.path.basename(o), Image.open(o)))
+        save_layers_to_pdf(layers, args.merge)
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(outs)}/{len(paths)} files in {elapsed:.2f}s "
+          f"({len(outs) / elapsed:.2f} files/s), {len(failures)} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
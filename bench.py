@@ -0,0 +1,364 @@
+"""
+Headless benchmarks for the logic and rendering hot paths.
+
+Generates synthetic images and PDFs, times each case and records its peak
+memory, then compares the results against a stored baseline. Qt runs
+offscreen for the widget cases. Examples:
+
+    python bench.py                      # run everything, compare to bench_baseline.json
+    python bench.py -k composite --quick
+    python bench.py --save               # record this machine's baseline
+    python bench.py --threshold 0.10     # fail on a >10% slowdown
+
+Exits 1 if any case regresses past the threshold.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import fitz  # PyMuPDF
+from PIL import Image
+
+from logic import (
+    Layer, FileLayer, to_alpha, invert_color, apply_effects, composite_layers,
+    load_pdf_layers, save_layers_to_pdf, PdfExportSettings
+)
+from compositor import CompositeCache
+from resultcache import result_cache
+
+BASELINE = "bench_baseline.json"
+
+# (width, height) of the synthetic images; --quick keeps the first of each list
+SIZES = {"1MP": (1200, 900), "12MP": (4000, 3000)}
+LAYER_COUNTS = [4, 16]
+PAGE_COUNTS = [20, 200]
+# Seconds the warm-up startup case may take before the process counts as hung
+WARM_UP_TIMEOUT = 120
+
+
+class PeakMemory:
+    """
+    Peak memory above the starting point while the block runs, in bytes.
+    Samples the resident set on Linux, which also sees Pillow and Qt
+    buffers; elsewhere falls back to tracemalloc, which sees Python and
+    NumPy allocations only.
+    """
+    INTERVAL = 0.002
+
+    def __enter__(self):
+        self.peak = 0
+        gc.collect()
+        _trim()
+        if os.path.exists("/proc/self/statm"):
+            self._page = os.sysconf("SC_PAGE_SIZE")
+            self._start = self._rss()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            self._thread = None
+            tracemalloc.start()
+        return self
+
+    def _rss(self):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * self._page
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss() - self._start)
+            time.sleep(self.INTERVAL)
+
+    def __exit__(self, *exc):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self._rss() - self._start)
+        else:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+def _trim():
+    # Hand freed heap back to the OS, or memory reused from earlier cases never shows up in the RSS
+    libc = ctypes.util.find_library("c")
+    if libc and sys.platform.startswith("linux"):
+        ctypes.CDLL(libc).malloc_trim(0)
+
+
+def measure(func, repeat):
+    """Best wall time over repeat runs, and the peak memory of the first run."""
+    times, peak = [], 0
+    for i in range(repeat):
+        with PeakMemory() as mem:
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        if i == 0:
+            peak = mem.peak
+    return min(times), peak
+
+
+# --- Synthetic data ---------------------------------------------------------
+
+def photo(size, seed=0):
+    """An RGB image with smooth gradients plus noise, so it compresses like a photo."""
+    w, h = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w]
+    arr = np.stack([x * 255 // w, y * 255 // h, (x + y) * 255 // (w + h)], -1).astype(np.uint8)
+    arr += rng.integers(0, 16, arr.shape, dtype=np.uint8)
+    return Image.fromarray(arr)
+
+def cutout(size, seed=0):
+    """An RGBA image whose alpha covers an ellipse, like a layer after background removal."""
+    img = photo(size, seed).convert("RGBA")
+    w, h = size
+    y, x = np.ogrid[0:h, 0:w]
+    inside = ((x - w / 2) / (w / 3)) ** 2 + ((y - h / 2) / (h / 3)) ** 2 <= 1
+    img.putalpha(Image.fromarray((inside * 255).astype(np.uint8)))
+    return img
+
+def layer_stack(size, count):
+    # An opaque background with cut-outs above it
+    return [Layer("bg", photo(size))] + [Layer(f"l{i}", cutout(size, i)) for i in range(1, count)]
+
+def make_pdf(path, pages):
+    """A PDF of text pages with a small embedded image every few pages."""
+    doc = fitz.open()
+    stamp = photo((300, 200))
+    buf = io.BytesIO()
+    stamp.save(buf, "JPEG")
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i + 1}", fontsize=24)
+        page.insert_textbox(fitz.Rect(72, 120, 520, 700), "Lorem ipsum dolor sit amet. " * 40)
+        if i % 5 == 0:
+            page.insert_image(fitz.Rect(72, 600, 372, 800), stream=buf.getvalue())
+    doc.save(path)
+    doc.close()
+
+
+# --- Cases ------------------------------------------------------------------
+# Each case factory returns (setup, run): setup builds inputs and is not
+# timed, run(inputs) is.
+
+def composite_cases(quick):
+    for size_name, size in list(SIZES.items())[:1 if quick else None]:
+        for count in LAYER_COUNTS[:1 if quick else None]:
+            yield (f"composite/cold/{size_name}/{count}",
+                   lambda size=size, count=count: layer_stack(size, count),
+                   lambda layers: composite_layers(layers))
+
+            def edit_setup(size=size, count=count):
+                layers = layer_stack(size, count)
+                cache = CompositeCache()
+                composite_layers(layers, cache)
+                return layers, cache
+
+            def edit(inputs):
+                # New pixels in a middle layer: only the prefix below it can be reused.
+                # (Toggling visibility would hit the cache outright once both states are in it)
+                layers, cache = inputs
+                layer = layers[len(layers) // 2]
+                layer.img = layer.tiles
+                composite_layers(layers, cache)
+
+            yield f"composite/cached-edit/{size_name}/{count}", edit_setup, edit
+
+def effect_cases(quick):
+    for size_name, size in list(SIZES.items())[:1 if quick else None]:
+        yield f"to_alpha/{size_name}", lambda size=size: photo(size), to_alpha
+        yield f"invert_color/{size_name}", lambda size=size: cutout(size), invert_color
+        yield (f"effect_chain/{size_name}", lambda size=size: photo(size),
+               lambda img: apply_effects(img, [invert_color, to_alpha, invert_color]))
+
+def import_cases(quick, tmp):
+    for size_name, size in list(SIZES.items())[:1 if quick else None]:
+        path = os.path.join(tmp, f"photo_{size_name}.jpg")
+
+        def source(path=path, size=size):
+            if not os.path.exists(path):
+                photo(size).save(path, quality=90)
+            return path
+
+        # What the list and preview need right after import, then what an effect or export needs
+        yield (f"import/draft-preview/{size_name}", source,
+               lambda path: FileLayer("photo", path).preview((800, 600)))
+        yield f"import/full-decode/{size_name}", source, lambda path: FileLayer("photo", path).pixels()
+
+def pdf_cases(quick, tmp):
+    for pages in PAGE_COUNTS[:1 if quick else None]:
+        path = os.path.join(tmp, f"in_{pages}.pdf")
+
+        def source(path=path, pages=pages):
+            if not os.path.exists(path):
+                make_pdf(path, pages)
+            return path
+
+        yield f"load_pdf_layers/{pages}p", source, load_pdf_layers
+
+        out = os.path.join(tmp, "out.pdf")
+        yield (f"save_layers_to_pdf/passthrough/{pages}p",
+               lambda source=source: load_pdf_layers(source()),
+               lambda layers: save_layers_to_pdf(layers, out))
+
+        def edited(source=source):
+            layers = load_pdf_layers(source())
+            for l in layers:
+                l.add_op(invert_color)
+            return layers
+
+        yield f"save_layers_to_pdf/edited/{pages}p", edited, lambda layers: save_layers_to_pdf(layers, out)
+        small = PdfExportSettings(quality=60, dpi=100)
+        yield (f"save_layers_to_pdf/edited-100dpi/{pages}p", edited,
+               lambda layers: save_layers_to_pdf(layers, out, settings=small))
+
+def paint_cases(quick):
+    from PyQt6.QtWidgets import QApplication
+    from ui import CheckerLabel
+
+    app = QApplication.instance() or QApplication([])
+
+    for size_name, size in list(SIZES.items())[:1 if quick else None]:
+        def setup(size=size):
+            label = CheckerLabel()
+            label.resize(1000, 700)
+            return label, photo(size)
+
+        def first_paint(inputs):
+            # Converting and scaling a new image, as selecting a layer does; uncached,
+            # so every run converts and scales again rather than reusing the first
+            label, img = inputs
+            label.set_image(img, cache=False)
+            label.grab()
+
+        def repaint(inputs):
+            label, img = inputs
+            if label.current_image is None:
+                label.set_image(img)
+                label.grab()
+            for _ in range(10):
+                label.grab()
+
+        def drag_resize(inputs):
+            # A window drag: many sizes in quick succession, then the smooth pass
+            label, img = inputs
+            if label.current_image is None:
+                label.set_image(img)
+            for w in range(600, 1000, 20):
+                label.resize(w, w * 7 // 10)
+                label.grab()
+            label._end_resize()
+            label.grab()
+
+        yield f"paint/first/{size_name}", setup, first_paint
+        yield f"paint/repaint-x10/{size_name}", setup, repaint
+        yield f"paint/drag-resize/{size_name}", setup, drag_resize
+
+
+def startup_cases(quick):
+    # A fresh interpreter each run; peak memory is the parent's, so it reads ~0
+    here = os.path.dirname(os.path.abspath(__file__))
+    cmd = [sys.executable, os.path.join(here, "main.py"), "--startup-time"]
+    yield ("startup/main-window", lambda: None,
+           lambda _: subprocess.run(cmd, check=True, capture_output=True, cwd=here))
+
+    # Quits as soon as rembg and PyMuPDF are loaded; importing rembg on the wrong
+    # thread leaves the process hanging at exit, which the timeout turns into a failure
+    warm = [sys.executable, os.path.join(here, "main.py"), "--quit-after-warm-up"]
+    yield ("startup/warm-up-and-quit", lambda: None,
+           lambda _: subprocess.run(warm, check=True, capture_output=True, cwd=here, timeout=WARM_UP_TIMEOUT))
+
+
+def all_cases(quick, tmp):
+    yield from startup_cases(quick)
+    yield from composite_cases(quick)
+    yield from effect_cases(quick)
+    yield from import_cases(quick, tmp)
+    yield from pdf_cases(quick, tmp)
+    yield from paint_cases(quick)
+
+
+# --- Reporting --------------------------------------------------------------
+
+def compare(name, result, baseline, threshold, mem_threshold):
+    """Returns a list of regression messages for one case."""
+    base = baseline.get(name)
+    if not base:
+        return []
+    problems = []
+    if result["time"] > base["time"] * (1 + threshold):
+        problems.append(f"time {result['time'] * 1e3:.1f} ms vs {base['time'] * 1e3:.1f} ms")
+    # Small allocations are noise; only flag growth beyond a megabyte
+    if result["peak"] > base["peak"] * (1 + mem_threshold) + 1024 * 1024:
+        problems.append(f"peak {result['peak'] / 2**20:.1f} MiB vs {base['peak'] / 2**20:.1f} MiB")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the logic and rendering hot paths.")
+    parser.add_argument("-k", dest="pattern", default="", help="only run cases whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="smallest size of each case only")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per case; the best time is kept")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to compare against or save to")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown as a fraction of the baseline time (default 0.25)")
+    parser.add_argument("--mem-threshold", type=float, default=0.25,
+                        help="allowed peak memory growth as a fraction of the baseline (default 0.25)")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # Start from an empty result cache so runs measure the real work
+        result_cache.directory = os.path.join(tmp, "cache")
+        for name, setup, run in all_cases(args.quick, tmp):
+            if args.pattern not in name:
+                continue
+            inputs = setup()
+            secs, peak = measure(lambda: run(inputs), args.repeat)
+            del inputs
+            results[name] = {"time": secs, "peak": peak}
+
+            problems = compare(name, results[name], baseline, args.threshold, args.mem_threshold)
+            regressions += bool(problems)
+            status = "REGRESSED" if problems else ("ok" if name in baseline else "new")
+            print(f"{name:45} {secs * 1e3:10.1f} ms {peak / 2**20:9.1f} MiB  {status}"
+                  + (f"  ({'; '.join(problems)})" if problems else ""))
+
+    if args.save:
+        if os.path.exists(args.baseline):
+            # Keep cases that were filtered out of this run
+            with open(args.baseline) as f:
+                results = {**json.load(f), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} cases to {args.baseline}")
+
+    if regressions:
+        print(f"{regressions} case(s) regressed past the threshold", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Single-buffer compositing engine.
+
+Layers are blended bottom-up into one preallocated RGBA canvas, one stored
+region (tile) at a time, touching only the bounding box of each region's
+non-transparent pixels. Blending goes through
+Pillow's in-place ``alpha_composite``, so the result is bit-identical to
+stacking full-size canvases with ``Image.alpha_composite``.
+
+``CompositeCache`` keeps composited prefixes of a stack between calls so that
+a change only recomposites the layers above it.
+"""
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# Modes that convert to RGBA with a constant alpha of 255
+_OPAQUE_MODES = ("RGB", "L")
+
+
+def canvas_size(layers):
+    """Size of the canvas a stack composites onto (largest width and height)."""
+    return max(l.size[0] for l in layers), max(l.size[1] for l in layers)
+
+
+def layer_region(img):
+    """
+    Returns (image, (x, y), opaque) with the image cropped to the bounding box
+    of its non-transparent pixels, or None if nothing would be drawn.
+    """
+    if img.mode in _OPAQUE_MODES and "transparency" not in img.info:
+        return img, (0, 0), True
+
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    bbox = img.getbbox(alpha_only=True)
+    if bbox is None:
+        return None
+    if bbox != (0, 0) + img.size:
+        img = img.crop(bbox)
+    return img, bbox[:2], False
+
+
+def composite_into(canvas, layers):
+    """Blends the visible layers onto an RGBA canvas in place, bottom-up."""
+    for l in layers:
+        if not l.visible:
+            continue
+        for piece, (x, y) in l.regions():
+            region = layer_region(piece)
+            if region is None:
+                continue
+            img, (dx, dy), opaque = region
+            if opaque:
+                # "Over" with an opaque source is a plain copy
+                canvas.paste(img, (x + dx, y + dy))
+            else:
+                canvas.alpha_composite(img, (x + dx, y + dy))
+    return canvas
+
+
+def composite(layers):
+    """Stacks layers bottom-up into a new RGBA image."""
+    return composite_into(Image.new("RGBA", canvas_size(layers)), layers)
+
+
+class CompositeCache:
+    """
+    Stores composited prefixes of a layer stack, keyed by canvas size and the
+    version of every visible layer in the prefix. Editing a layer bumps its
+    version; hiding or moving it changes which versions are in the prefix;
+    so any change invalidates exactly the prefixes above it.
+
+    Checkpoints are kept below the position where the stack last changed,
+    below the top layer and for the full stack. Entries are evicted
+    least-recently-used once their total size exceeds ``max_bytes``.
+    Returned images are shared with the cache and must not be modified.
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._last = ()
+        self._lock = threading.Lock()
+
+    def composite(self, layers):
+        with self._lock:
+            return self._composite(layers)
+
+    def _composite(self, layers):
+        size = canvas_size(layers)
+        versions = tuple(l.version for l in layers if l.visible)
+        stack = [l for l in layers if l.visible]
+
+        start, canvas = 0, None
+        for n in range(len(stack), 0, -1):
+            hit = self._entries.get((size, versions[:n]))
+            if hit is not None:
+                self._entries.move_to_end((size, versions[:n]))
+                start, canvas = n, hit
+                break
+        if start == len(stack) and canvas is not None:
+            self._last = versions
+            return canvas
+
+        # First position that differs from the previous stack, i.e. the layer just changed
+        changed = next((i for i, (a, b) in enumerate(zip(versions, self._last)) if a != b),
+                       min(len(versions), len(self._last)))
+        self._last = versions
+        checkpoints = sorted({p for p in (changed, len(stack) - 1) if p > start} | {len(stack)})
+
+        canvas = canvas.copy() if canvas is not None else Image.new("RGBA", size)
+        pos = start
+        for p in checkpoints:
+            composite_into(canvas, stack[pos:p])
+            pos = p
+            self._store((size, versions[:p]), canvas if p == len(stack) else canvas.copy())
+        return canvas
+
+    def _store(self, key, img):
+        nbytes = img.width * img.height * 4
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = img
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.width * old.height * 4
@@ -0,0 +1,17 @@
+import numpy as np
+from PIL import Image
+
+# test_dialog.py is a manual check of the file dialog, not a test module
+collect_ignore = ["test_dialog.py"]
+
+
+def noise(size, mode="RGB", seed=0):
+    """A reproducible random image."""
+    bands = {"RGB": 3, "RGBA": 4, "L": 1}[mode]
+    shape = (size[1], size[0], bands) if bands > 1 else (size[1], size[0])
+    return Image.fromarray(np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8), mode)
+
+
+def same(a, b):
+    """True if two PIL images have the same mode, size and pixels."""
+    return a.mode == b.mode and a.size == b.size and a.tobytes() == b.tobytes()
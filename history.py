@@ -0,0 +1,192 @@
+"""
+Undo/redo for layer edits.
+
+An edit keeps the tiles it changed, zlib-compressed, as they were before.
+Unchanged tiles are never copied: undoing builds the previous image from the
+current one with TiledImage.patched, sharing every other tile and only
+decompressing the changed ones when they are next read, so it takes
+milliseconds however large the layer is. The undone image is kept for redo;
+it shares its unchanged tiles with the restored one, and its changed tiles
+live in tile_store, which spills them to disk under memory pressure.
+
+Recording a lazy effect (Layer.add_op) changes no tiles, so its edit only
+keeps the layer's previous op chain.
+
+Restoring a state also restores the layer version it had, so composites
+cached for that state are reused.
+"""
+from dataclasses import dataclass
+
+from tiles import TiledImage, worker_pool
+
+
+@dataclass
+class Delta:
+    """
+    Compressed tiles of a layer's previous image and its pending ops.
+    tiles is None for an unedited PDF page.
+    """
+    size: tuple = None
+    mode: str = None
+    tiles: dict = None
+    ops: tuple = ()
+    version: int = 0
+
+    @property
+    def nbytes(self):
+        return sum(len(t) for t in (self.tiles or {}).values() if t)
+
+
+@dataclass
+class Edit:
+    layer: object
+    before: Delta
+    # The image, ops and version an undo replaced, kept for redo
+    after: TiledImage = None
+    after_ops: tuple = ()
+    after_version: int = 0
+
+
+@dataclass
+class Pending:
+    """An edit computed off the GUI thread, waiting for History.commit."""
+    layer: object
+    base: TiledImage
+    result: TiledImage
+    delta: Delta
+    # The layer's ops and version when the edit's input was read
+    ops: tuple = ()
+    version: int = 0
+
+
+def diff(base, result):
+    """The Delta that turns result back into base; base is None for an unedited PDF page."""
+    if base is None:
+        return Delta()
+    if (base.size, base.mode) == (result.size, result.mode):
+        indexes = base.changed(result)
+    else:
+        indexes = [i for i, _ in base.boxes()]
+    return Delta(base.size, base.mode, dict(zip(indexes, worker_pool.map(base.pack, indexes))))
+
+
+class History:
+    """
+    Linear undo/redo stacks of layer edits. Once the undo deltas exceed
+    max_bytes, the oldest edits are dropped.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._undo = []
+        self._redo = []
+        self._bytes = 0
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    @staticmethod
+    def prepare(layer, base, img, ops=None, version=None):
+        """
+        Tiles img and diffs it against base, the layer's tiles it was computed
+        from, with ops and version the layer had then (by default, what it has
+        now). Safe to call from a worker thread.
+        """
+        result = img if isinstance(img, TiledImage) else TiledImage.from_image(img)
+        if version is None:
+            ops, version = layer.ops, layer.version
+        return Pending(layer, base, result, diff(base, result), tuple(ops), version)
+
+    def commit(self, pending):
+        """Applies a prepared edit to its layer and records it as one step."""
+        layer = pending.layer
+        delta = pending.delta
+        if layer.tiles is not pending.base:
+            # The layer changed since the edit was prepared; diff against what it is now
+            delta = diff(layer.tiles, pending.result)
+        added = ()
+        if layer.version != pending.version:
+            # Ops recorded while the edit ran aren't in its result; keep them on top
+            if layer.tiles is not pending.base:
+                added = layer.ops
+            elif layer.ops[:len(pending.ops)] == pending.ops:
+                added = layer.ops[len(pending.ops):]
+        delta.ops, delta.version = layer.ops, layer.version
+        layer.img = pending.result
+        for op in added:
+            layer.add_op(op)
+        self._record([Edit(layer, delta)])
+
+    def add_op(self, layers, effect):
+        """Records a lazy effect on several layers as one step."""
+        edits = []
+        for layer in layers:
+            tiles = None if layer.tiles is None else {}
+            edits.append(Edit(layer, Delta(layer.size, None, tiles, layer.ops, layer.version)))
+            layer.add_op(effect)
+        self._record(edits)
+
+    def _record(self, step):
+        if not step:
+            return  # Nothing changed, so nothing to undo; keep the redo stack
+        for edits in self._redo:
+            self._bytes -= _nbytes(edits)
+        self._redo.clear()
+        self._undo.append(step)
+        self._bytes += _nbytes(step)
+        while self._bytes > self.max_bytes and self._undo:
+            self._bytes -= _nbytes(self._undo.pop(0))
+
+    def undo(self):
+        """Reverts the latest step and returns its layers, or [] if there is nothing to undo."""
+        if not self._undo:
+            return []
+        step = self._undo.pop()
+        for edit in reversed(step):
+            layer, delta = edit.layer, edit.before
+            edit.after, edit.after_ops, edit.after_version = layer.tiles, layer.ops, layer.version
+            if delta.tiles is None:
+                layer.img = None
+            elif not delta.tiles:
+                layer.img = layer.tiles  # Only the ops changed
+            else:
+                base = layer.tiles or TiledImage(delta.size, delta.mode)
+                layer.img = base.patched(delta.size, delta.mode, delta.tiles)
+            layer.ops, layer.version = delta.ops, delta.version
+        self._redo.append(step)
+        return [edit.layer for edit in step]
+
+    def redo(self):
+        if not self._redo:
+            return []
+        step = self._redo.pop()
+        for edit in step:
+            edit.layer.img = edit.after
+            edit.layer.ops, edit.layer.version = edit.after_ops, edit.after_version
+            edit.after = None
+        self._undo.append(step)
+        return [edit.layer for edit in step]
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._bytes = 0
+
+    def forget(self, layer):
+        """Drops a layer's edits, e.g. once it is removed."""
+        for stack in (self._undo, self._redo):
+            for step in stack:
+                self._bytes -= _nbytes(step)
+                step[:] = [e for e in step if e.layer is not layer]
+                self._bytes += _nbytes(step)
+            stack[:] = [step for step in stack if step]
+
+
+def _nbytes(edits):
+    return sum(edit.before.nbytes for edit in edits)
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import deque
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from logic import Cancelled
+from profiling import span
+
+class Job(QObject):
+    """
+    One unit of work for the JobScheduler. The function runs on a pool thread;
+    the signals are delivered on the GUI thread.
+    """
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    # Results handed over before the job ends, see JobScheduler.submit
+    partial = pyqtSignal(object)
+    canceled = pyqtSignal()
+    _ended = pyqtSignal()
+
+    def __init__(self, func, args, key=None, group=None, label="", report=False, streams=False):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.key = key
+        self.group = group
+        self.label = label
+        # Long jobs take progress(done, total) and cancelled() hooks
+        self.report = report
+        self.streams = streams
+        self.running = False
+        self.done = self.total = 0
+        self.queued = time.perf_counter()
+        self._cancel = threading.Event()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self):
+        kwargs = {}
+        if self.report:
+            kwargs = dict(progress=self.progress.emit, cancelled=self.cancelled)
+        if self.streams:
+            kwargs["partial"] = self.partial.emit
+        wait_ms = round((time.perf_counter() - self.queued) * 1e3, 2)
+        name = self.label or getattr(self.func, "__name__", "job")
+        try:
+            if self.cancelled():
+                raise Cancelled()
+            with span(name, cat="job", group=self.group, wait_ms=wait_ms):
+                result = self.func(*self.args, **kwargs)
+            if self.cancelled():
+                raise Cancelled()
+            self.finished.emit(result)
+        except Cancelled:
+            self.canceled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            self._ended.emit()
+
+class _Runnable(QRunnable):
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+
+    def run(self):
+        self.job.run()
+
+class JobScheduler(QObject):
+    """
+    Runs jobs on a shared thread pool.
+
+    Jobs with the same key run one at a time, in submission order, so edits to
+    a layer are applied in order. Submitting with coalesce=True drops any jobs
+    still waiting under that key, so only the latest refresh or composite
+    request runs. A group caps how many of its jobs run at once (see
+    set_limit). `changed` fires whenever the set of jobs or their progress changes.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads or os.cpu_count() or 1)
+        self.jobs = []
+        self.completed = 0
+        self._queues = {}
+        self._busy_keys = set()
+        self._limits = {}
+        self._running_groups = {}
+        self._waiting_groups = {}
+
+    def set_limit(self, group, n):
+        self._limits[group] = n
+
+    def submit(self, func, *args, key=None, coalesce=False, group=None, label="", report=False,
+               on_done=None, on_error=None, on_partial=None):
+        """
+        Queues func(*args) and returns its Job. Callbacks are connected before it
+        can start. With on_partial, func also takes a partial(result) hook to pass
+        results on while it runs; they arrive on the GUI thread in order.
+        """
+        job = Job(func, args, key, group, label, report, streams=on_partial is not None)
+        if on_partial:
+            job.partial.connect(on_partial)
+        if on_done:
+            job.finished.connect(on_done)
+        if on_error:
+            job.error.connect(on_error)
+        job.progress.connect(lambda done, total: self._on_progress(job, done, total))
+        job._ended.connect(lambda: self._on_ended(job))
+        self.jobs.append(job)
+
+        if key is None:
+            self._ready(job)
+        else:
+            queue = self._queues.setdefault(key, deque())
+            if coalesce:
+                while queue:
+                    self._drop(queue.pop())
+            queue.append(job)
+            if key not in self._busy_keys:
+                self._next_for_key(key)
+        self.changed.emit()
+        return job
+
+    def cancel(self, job):
+        job._cancel.set()
+        if job.running:
+            return  # It stops at its next cancelled() check, or discards its result
+        queue = self._queues.get(job.key)
+        if queue and job in queue:
+            queue.remove(job)
+        waiting = self._waiting_groups.get(job.group)
+        if waiting and job in waiting:
+            waiting.remove(job)
+            self._busy_keys.discard(job.key)
+            self._next_for_key(job.key)
+        self._drop(job)
+        self.changed.emit()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def _drop(self, job):
+        job._cancel.set()
+        job.canceled.emit()
+        self.jobs.remove(job)
+
+    def _next_for_key(self, key):
+        queue = self._queues.get(key)
+        if not queue:
+            self._queues.pop(key, None)
+            return
+        self._busy_keys.add(key)
+        self._ready(queue.popleft())
+
+    def _ready(self, job):
+        limit = self._limits.get(job.group)
+        if limit is not None and self._running_groups.get(job.group, 0) >= limit:
+            self._waiting_groups.setdefault(job.group, deque()).append(job)
+            return
+        self._running_groups[job.group] = self._running_groups.get(job.group, 0) + 1
+        job.running = True
+        self.pool.start(_Runnable(job))
+
+    def _on_progress(self, job, done, total):
+        job.done, job.total = done, total
+        self.changed.emit()
+
+    def _on_ended(self, job):
+        job.running = False
+        self.jobs.remove(job)
+        self.completed += 1
+        if not self.jobs:
+            self.completed = 0
+
+        self._running_groups[job.group] -= 1
+        waiting = self._waiting_groups.get(job.group)
+        if waiting:
+            self._ready(waiting.popleft())
+        if job.key is not None:
+            self._busy_keys.discard(job.key)
+            self._next_for_key(job.key)
+        self.changed.emit()
@@ -1,102 +1,837 @@
+import contextlib
+import functools
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from PIL import Image, ImageOps
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image, ImageChops
 import numpy as np
-from rembg import remove
-from PyQt6.QtCore import QThread, pyqtSignal
-import fitz  # PyMuPDF
+# rembg (which loads onnxruntime) and PyMuPDF are imported where first used,
+# so starting the app doesn't pay for them; see warm_up
+
+import compositor
+from profiling import span, traced, size_of
+from resultcache import result_cache, digest_image, digest_file
+from tiles import TiledImage, storable, worker_pool
+
+# Global so a version also identifies which layer it belongs to
+_versions = itertools.count(1)
 
-@dataclass
 class Layer:
-    name: str
-    img: Image.Image
-    visible: bool = True
+    """
+    A named image in the stack. Pixels are kept as a TiledImage, so cold
+    parts of large layers can be spilled to disk; img assembles a full PIL
+    image, while regions() and preview() work tile by tile.
+
+    Per-pixel effects are recorded in ops rather than applied straight away.
+    The chain is fused and run over the tiles once, when the pixels are first
+    needed; previews run it over the reduced image only.
+    Layers compare by identity.
+    """
+    def __init__(self, name, img, visible=True):
+        self.name = name
+        self.visible = visible
+        self.img = img
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r}, visible={self.visible})"
+
+    @property
+    def img(self):
+        return self.pixels().to_image()
+
+    @img.setter
+    def img(self, value):
+        # Every new image gets a fresh version so cached composites can tell it apart
+        self.version = next(_versions)
+        if value is not None and not isinstance(value, TiledImage):
+            value = TiledImage.from_image(value)
+        self.tiles = value
+        self.ops = ()
+
+    def add_op(self, effect):
+        """Records a per-pixel effect (see kernel_effect) to run with the rest of the chain."""
+        self.ops += (effect,)
+        self.version = next(_versions)
+
+    def base_tiles(self, keep=True):
+        """Pixels before the pending ops. keep=False skips caching anything decoded or rendered."""
+        return self.tiles
+
+    def pixels(self, keep=True):
+        """
+        The layer's pixels as a TiledImage, running any pending ops once per
+        version. keep=False skips caching the result, for one-off reads.
+        """
+        if not self.ops:
+            return self.base_tiles(keep)
+        rendered = getattr(self, "_rendered", None)
+        if rendered is None or rendered[0] != self.version:
+            with span("render ops", ops=[op.__name__ for op in self.ops], size=size_of(self)):
+                rendered = (self.version, self.base_tiles(keep).map(fuse(self.ops)))
+            if keep:
+                self._rendered = rendered
+        return rendered[1]
 
     @property
     def display(self):
-        return self.img.convert("RGBA")
+        # Avoid a copy when the image is already RGBA
+        img = self.img
+        return img if img.mode == "RGBA" else img.convert("RGBA")
+
+    @property
+    def size(self):
+        return self.tiles.size
+
+    def regions(self, keep=True):
+        """Yields (image, (x, y)) pieces that together make up the layer."""
+        return self.pixels(keep).regions()
+
+    @traced("Layer.preview", meta=lambda self, size: {"layer": size_of(self), "box": size})
+    def preview(self, size):
+        """
+        Image for showing the layer in a (w, h) box. May be below full
+        resolution; pending ops then run on the reduced image, which can
+        differ from reducing the full result by a rounding step.
+        """
+        w, h = self.size
+        scale = min(size[0] / w, size[1] / h, 1.0)
+        # Power-of-two box reduction stays at or above the shown size
+        factor = 1 << max(0, min(8, int(math.log2(1 / scale)))) if scale > 0 else 1
+        rendered = getattr(self, "_rendered", None)
+        if not self.ops or (rendered and rendered[0] == self.version):
+            return self.pixels().reduce(factor)
+        return fuse(self.ops)(self.base_tiles().reduce(factor))
+
+class FileLayer(Layer):
+    """
+    An image file decoded only as far as it is needed. Until the layer is
+    edited, preview() uses a reduced-resolution draft decode where the format
+    supports one (JPEG scales by 1/2 to 1/8 while decoding); the full decode
+    happens, once, the first time its pixels are read, e.g. by an effect,
+    the composite or an export. The file is reopened for each decode, so no
+    handle is held between them.
+    """
+    # Draft decodes kept per layer, largest last
+    MAX_DRAFTS = 2
+
+    def __init__(self, name, path, visible=True):
+        self.path = path
+        with Image.open(path) as img:
+            self._size = img.size
+            self._draftable = img.format == "JPEG"
+        self._decoded = None
+        self._drafts = []
+        self._lock = threading.Lock()
+        super().__init__(name, None, visible)
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Source of layer {self.name!r} not found: {self.path}")
+        return Image.open(self.path)
 
-class Worker(QThread):
-    finished = pyqtSignal(object)
-    error = pyqtSignal(str)
+    # Layer.__init__ assigns None, which leaves the file unedited
+    @property
+    def size(self):
+        return self.tiles.size if self.tiles is not None else self._size
+
+    def base_tiles(self, keep=True):
+        if self.tiles is not None:
+            return self.tiles
+        with self._lock:
+            if self._decoded is not None:
+                return self._decoded
+            with span("decode image", file=os.path.basename(self.path), size=size_of(self)):
+                with self._open() as img:
+                    decoded = TiledImage.from_image(img)
+            if keep:
+                self._decoded = decoded
+            return decoded
+
+    def draft(self, size):
+        """The image decoded at the smallest draft scale that still covers a (w, h) box."""
+        w, h = self._size
+        scale = min(size[0] / w, size[1] / h, 1.0)
+        want = (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale)))
+        with self._lock:
+            for img in self._drafts:
+                if img.width >= want[0] and img.height >= want[1]:
+                    return img
+        with span("draft decode", file=os.path.basename(self.path), box=size):
+            with self._open() as img:
+                img.draft(img.mode, want)
+                img = storable(img)
+                img.load()
+        with self._lock:
+            self._drafts = sorted(self._drafts + [img], key=lambda d: d.width)[-self.MAX_DRAFTS:]
+        return img
 
-    def __init__(self, func, *args):
-        super().__init__()
-        self.func = func
-        self.args = args
+    @traced("FileLayer.preview", meta=lambda self, size: {"layer": size_of(self), "box": size})
+    def preview(self, size):
+        if self.tiles is not None or self._decoded is not None or not self._draftable:
+            return super().preview(size)
+        img = self.draft(size)
+        return fuse(self.ops)(img) if self.ops else img
+
+@traced("import_images", meta=lambda paths, *a, **k: {"files": len(paths)})
+def import_images(paths, box=None, partial=None, progress=None, cancelled=None):
+    """
+    Opens image files as FileLayers across a thread pool, passing each to
+    partial([layer]) in the order given as soon as it and those before it are
+    ready. With a preview box, each file's draft for it is decoded up front,
+    so showing it is instant. Returns (path, error message) for files that
+    could not be opened.
+    """
+    def open_one(path):
+        layer = FileLayer(os.path.basename(path), path)
+        if box:
+            layer.preview(box)
+        return layer
+
+    futures = [worker_pool.submit(open_one, p) for p in paths]
+    failed = []
+    try:
+        for done, (path, fut) in enumerate(zip(paths, futures), 1):
+            if cancelled and cancelled():
+                raise Cancelled()
+            try:
+                layer = fut.result()
+            except Exception as e:
+                failed.append((path, str(e)))
+            else:
+                if partial:
+                    partial([layer])
+            if progress:
+                progress(done, len(paths))
+    finally:
+        for fut in futures:
+            fut.cancel()
+    return failed
 
-    def run(self):
+# None uses whatever model rembg itself defaults to
+DEFAULT_MODEL = None
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def import_rembg():
+    """
+    Imports rembg. Call on the main thread before rembg is first used from
+    another: imported on a worker thread, it (through pymatting and numba)
+    leaves the process hanging at exit.
+    """
+    import rembg
+    return rembg
+
+def get_session(model=DEFAULT_MODEL):
+    """Returns the shared rembg session for a model, creating it on first use."""
+    rembg = import_rembg()
+    with _sessions_lock:
+        if model not in _sessions:
+            _sessions[model] = rembg.new_session(model) if model else rembg.new_session()
+        return _sessions[model]
+
+def warm_up(model=DEFAULT_MODEL, done=None):
+    """
+    Imports rembg, then imports PyMuPDF and creates the model session on a
+    background thread, so their first use doesn't wait. Call on the main
+    thread once the UI is showing; see import_rembg. done(), if given, is
+    called from the background thread once it has finished, or failed.
+    """
+    try:
+        with span("import rembg", cat="startup"):
+            import_rembg()
+    except Exception:
+        model = False  # Reported on first real use
+
+    def warm():
         try:
-            self.finished.emit(self.func(*self.args))
-        except Exception as e:
-            self.error.emit(str(e))
+            with span("warm up", cat="startup"):
+                import fitz  # noqa: F401
+                if model is not False:
+                    get_session(model)
+        except Exception:
+            pass  # Raised again, and reported, on first real use
+        finally:
+            if done:
+                done()
+    threading.Thread(target=warm, daemon=True).start()
+
+@traced("rembg", meta=lambda img, model=DEFAULT_MODEL: {"size": size_of(img), "model": model})
+def remove(img, model=DEFAULT_MODEL):
+    """
+    Removes the background using the long-lived session for the model.
+    Results are kept in the persistent result_cache, keyed by the input pixels
+    and the model the session actually runs.
+    """
+    session = get_session(model)
+    # Not model itself: None means rembg's default, which changes between releases
+    key = result_cache.key("rembg", digest_image(img), model=session.name())
+    out = result_cache.get(key)
+    if out is None:
+        out = import_rembg().remove(img, session=session)
+        result_cache.put(key, out)
+    return out
+
+def kernel_effect(kernel):
+    """
+    Turns a kernel, which edits an RGBA uint8 array of shape (h, w, 4) in
+    place one pixel at a time, into an image effect. Effects made this way
+    can be recorded with Layer.add_op and fused into one pass with fuse().
+    """
+    @functools.wraps(kernel)
+    @traced(kernel.__name__, meta=lambda img: {"size": size_of(img)})
+    def effect(img):
+        return fuse((effect,))(img)
+    effect.kernel = kernel
+    return effect
 
-def to_alpha(img):
+def fuse(effects):
+    """
+    Combines kernel effects into one image function that converts to RGBA
+    once and runs every kernel over the same buffer.
+    """
+    kernels = [e.kernel for e in effects]
+    def run(img):
+        px = np.array(img if img.mode == "RGBA" else img.convert("RGBA"))
+        for kernel in kernels:
+            kernel(px)
+        return Image.fromarray(px)
+    return run
+
+def apply_effects(img, effects):
+    """Applies effects in order, fusing each run of kernel effects into one pass."""
+    run = []
+    for effect in list(effects) + [None]:
+        if effect is not None and hasattr(effect, "kernel"):
+            run.append(effect)
+            continue
+        if run:
+            img, run = fuse(run)(img), []
+        if effect is not None:
+            img = effect(img)
+    return img
+
+@kernel_effect
+def to_alpha(px):
     """Converts Greyscale intensity to Alpha transparency."""
-    arr = np.array(img.convert('L'))
-    h, w = arr.shape
-    rgba = np.zeros((h, w, 4), dtype=np.uint8)
-    rgba[..., 3] = 255 - arr
-    return Image.fromarray(rgba, 'RGBA')
+    # Pillow's luma conversion reads the buffer in place and beats any NumPy formulation
+    luma = np.asarray(Image.fromarray(px).convert("L"), dtype=np.uint32)
+    # Each pixel as one little-endian word: zero RGB, alpha in the top byte
+    px.view(np.uint32)[..., 0] = (255 - luma) << 24
 
-def invert_color(img):
+@kernel_effect
+def invert_color(px):
     """Inverts RGB channels, preserving Alpha."""
-    if img.mode != 'RGBA':
-        return ImageOps.invert(img.convert('RGB')).convert('RGBA')
-    r, g, b, a = img.split()
-    return Image.merge('RGBA', (*ImageOps.invert(Image.merge('RGB', (r, g, b))).split(), a))
+    # 255 - x is x ^ 0xFF; flipping the three low bytes of each pixel word is one contiguous pass
+    px.view(np.uint32)[...] ^= np.uint32(0x00FFFFFF)
 
-def composite_layers(layers):
-    """Stacks layers bottom-up."""
+@traced("composite", meta=lambda layers, cache=None: {
+    "layers": len(layers), "size": size_of(layers[0]) if layers else None, "cached": cache is not None})
+def composite_layers(layers, cache=None):
+    """Stacks layers bottom-up, reusing cached prefixes if a CompositeCache is given."""
     if not layers:
         return None
-    
-    # Calculate max dimensions
-    w = max(l.img.width for l in layers)
-    h = max(l.img.height for l in layers)
-    
-    canvas = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-    
-    for l in layers:
-        if l.visible:
-            layer_canvas = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-            layer_canvas.paste(l.display, (0, 0))
-            canvas = Image.alpha_composite(canvas, layer_canvas)
-    return canvas
+    if cache is not None:
+        return cache.composite(layers)
+    return compositor.composite(layers)
+
+# Resolution pages are rasterized at for editing and export
+PDF_DPI = 150
+# Renders quicker than this aren't worth writing to result_cache; reading back costs about as much
+CACHE_RENDER_SECONDS = 0.05
+
+class PdfSource:
+    """An open PDF document shared by the layers of its pages."""
+    def __init__(self, path):
+        import fitz  # PyMuPDF
+        self.path = path
+        self.doc = fitz.open(path)
+        st = os.stat(path)
+        self._stat = (st.st_size, st.st_mtime_ns)
+        # MuPDF documents must not be used from two threads at once
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc)
+
+    def page_size(self, index, dpi=PDF_DPI):
+        """Pixel size of a page rendered at dpi, without rendering it."""
+        import fitz
+        with self.lock:
+            rect = self.doc[index].rect
+        r = (rect * fitz.Matrix(dpi / 72, dpi / 72)).irect
+        return r.width, r.height
+
+    @functools.cached_property
+    def digest(self):
+        """Digest of the file as opened, or None if it has changed or gone since."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime_ns) != self._stat:
+            return None
+        return digest_file(self.path)
+
+    def render_key(self, index, dpi=PDF_DPI):
+        """result_cache key of a page render, or None if renders can't be cached."""
+        if self.digest is None:
+            return None
+        return result_cache.key("page", self.digest, page=index, dpi=dpi, alpha=False)
+
+    def render(self, index, dpi=PDF_DPI):
+        """Renders a page, or reads it from result_cache if it was rendered before."""
+        key = self.render_key(index, dpi)
+        img = result_cache.get(key)
+        if img is None:
+            start = time.perf_counter()
+            img = self.rasterize(index, dpi)
+            if time.perf_counter() - start >= CACHE_RENDER_SECONDS:
+                result_cache.put(key, img)
+        return img
+
+    @traced("rasterize page", meta=lambda self, index, dpi=PDF_DPI: {
+        "file": os.path.basename(self.path), "page": index, "dpi": dpi})
+    def rasterize(self, index, dpi=PDF_DPI):
+        with self.lock:
+            # alpha=False ensures we get a solid background (white paper), not transparency
+            pix = self.doc[index].get_pixmap(dpi=dpi, alpha=False)
+        return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+class PageCache:
+    """Rendered PDF pages, evicted least-recently-used once they exceed max_bytes."""
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, source, index, dpi):
+        key = (source, index, dpi)
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                return img
+
+        img = source.render(index, dpi)
+        self.put(source, index, dpi, img)
+        return img
+
+    def put(self, source, index, dpi, img):
+        """Adds a page rendered elsewhere, e.g. by import_pdf."""
+        key = (source, index, dpi)
+        nbytes = img.width * img.height * 3
+        with self._lock:
+            if key not in self._entries and nbytes <= self.max_bytes:
+                self._entries[key] = img
+                self._bytes += nbytes
+                while self._bytes > self.max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self._bytes -= old.width * old.height * 3
+
+page_cache = PageCache()
 
+class PdfLayer(Layer):
+    """
+    A PDF page that is only rasterized when its pixels are needed.
+    Until the page is edited, img renders it at PDF_DPI through the shared
+    page cache, and preview() renders it at about the size it is shown at.
+    """
+    def __init__(self, name, source, page_index, visible=True):
+        self.source = source
+        self.page_index = page_index
+        super().__init__(name, None, visible)
+
+    # Layer.__init__ assigns None, which leaves the page unedited
+    @Layer.img.getter
+    def img(self):
+        if self.modified:
+            return self.pixels().to_image()
+        return page_cache.get(self.source, self.page_index, PDF_DPI)
+
+    @property
+    def modified(self):
+        return self.tiles is not None or bool(self.ops)
+
+    def base_tiles(self, keep=True):
+        if self.tiles is not None:
+            return self.tiles
+        return TiledImage.from_image(self._page(keep))
+
+    def _page(self, keep):
+        # One-off reads such as exports render around page_cache, so they don't fill it
+        if keep:
+            return page_cache.get(self.source, self.page_index, PDF_DPI)
+        return self.source.render(self.page_index, PDF_DPI)
+
+    @property
+    def size(self):
+        if self.tiles is not None:
+            return self.tiles.size
+        return self.source.page_size(self.page_index)
+
+    def regions(self, keep=True):
+        if self.modified:
+            return super().regions(keep)
+        return [(self._page(keep), (0, 0))]
+
+    def preview_dpi(self, size):
+        """DPI preview() renders the page at to fit a (w, h) box."""
+        w, h = self.source.page_size(self.page_index)
+        scale = min(size[0] / w, size[1] / h, 1.0)
+        # Round up to an eighth of PDF_DPI so resizing reuses a handful of renders
+        return max(1, math.ceil(scale * 8)) * PDF_DPI // 8
+
+    @traced("PdfLayer.preview", meta=lambda self, size: {"page": self.page_index, "box": size})
+    def preview(self, size):
+        if self.tiles is not None:
+            return super().preview(size)
+        page = page_cache.get(self.source, self.page_index, self.preview_dpi(size))
+        return fuse(self.ops)(page) if self.ops else page
+
+@traced("load_pdf_layers", meta=lambda path, pdf_index=None: {"file": os.path.basename(path)})
 def load_pdf_layers(path, pdf_index=None):
-    """Opens a PDF and converts all pages to Layer objects."""
-    doc = fitz.open(path)
-    layers = []
-    
+    """Opens a PDF as one lazily rendered PdfLayer per page."""
+    source = PdfSource(path)
     prefix = f"PDF {pdf_index} " if pdf_index is not None else ""
-    
-    for i, page in enumerate(doc):
-        # Render page to image (dpi=150 is a good balance for screen/edit)
-        # alpha=False ensures we get a solid background (white paper), not transparency
-        pix = page.get_pixmap(dpi=150, alpha=False)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        layers.append(Layer(f"{prefix}Page {i+1}", img))
-    return layers
+    return [PdfLayer(f"{prefix}Page {i+1}", source, i) for i in range(len(source))]
 
-def save_layers_to_pdf(layers, path):
-    """Saves a list of layers as a single multi-page PDF."""
-    visible_imgs = []
-    
-    for l in layers:
-        if l.visible:
-            # Handle RGBA -> RGB conversion by pasting on white background
-            # This ensures any transparency becomes white paper, not black artifacts
-            if l.img.mode == 'RGBA':
-                background = Image.new("RGB", l.img.size, (255, 255, 255))
-                # Paste the image using its own alpha channel as the mask
-                background.paste(l.img, mask=l.img.split()[3])
-                visible_imgs.append(background)
+# Documents each render worker keeps open, most recently used last
+_worker_docs = OrderedDict()
+_WORKER_DOCS = 4
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def _render_in_worker(path, index, dpi):
+    """Process pool entry point: renders a page with the worker's own open copy of the document."""
+    import fitz
+    doc = _worker_docs.pop(path, None) or fitz.open(path)
+    _worker_docs[path] = doc
+    while len(_worker_docs) > _WORKER_DOCS:
+        _worker_docs.popitem(last=False)[1].close()
+    start = time.perf_counter()
+    pix = doc[index].get_pixmap(dpi=dpi, alpha=False)
+    return pix.width, pix.height, pix.samples, time.perf_counter() - start
+
+def render_pool():
+    """The shared process pool pages are rasterized on, started on first use."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Spawned, not forked: forking once rembg's native thread pools run deadlocks
+            ctx = multiprocessing.get_context("spawn")
+            _render_pool = ProcessPoolExecutor(os.cpu_count() or 1, mp_context=ctx)
+        return _render_pool
+
+def import_pdf(path, pdf_index=None, box=None, partial=None, progress=None, cancelled=None, chunk=8):
+    """
+    Opens a PDF as PdfLayers and passes them to partial(layers) in page
+    order, chunk pages at a time. With a preview box, the pages are first
+    rendered at their preview DPI across render_pool, as many as fit in half
+    of page_cache, so showing them is instant; pages rendered before are read
+    from result_cache instead. Each chunk is passed on as soon as its pages
+    are ready. Returns all the layers.
+    """
+    layers = load_pdf_layers(path, pdf_index)
+    jobs, budget = [], page_cache.max_bytes // 2
+    if box:
+        for l in layers:
+            dpi = l.preview_dpi(box)
+            w, h = l.source.page_size(l.page_index, dpi)
+            budget -= w * h * 3
+            if budget < 0:
+                break
+            key = l.source.render_key(l.page_index, dpi)
+            cached = result_cache.get(key)
+            if cached is not None:
+                jobs.append((l, dpi, key, cached))
             else:
-                visible_imgs.append(l.img.convert("RGB"))
-                
-    if not visible_imgs:
+                jobs.append((l, dpi, key, render_pool().submit(_render_in_worker, path, l.page_index, dpi)))
+
+    try:
+        for start in range(0, len(layers), chunk):
+            if cancelled and cancelled():
+                raise Cancelled()
+            for l, dpi, key, img in jobs[start:start + chunk]:
+                if not isinstance(img, Image.Image):
+                    w, h, samples, secs = img.result()
+                    img = Image.frombytes("RGB", (w, h), samples)
+                    if secs >= CACHE_RENDER_SECONDS:
+                        result_cache.put(key, img)
+                page_cache.put(l.source, l.page_index, dpi, img)
+            if partial:
+                partial(layers[start:start + chunk])
+            if progress:
+                progress(min(start + chunk, len(layers)), len(layers))
+    finally:
+        for *_, fut in jobs:
+            if not isinstance(fut, Image.Image):
+                fut.cancel()
+    return layers
+
+@traced("flatten", meta=lambda layer: {"size": size_of(layer)})
+def flatten_layer(layer):
+    """Flattens a layer onto white paper as RGB, one region at a time."""
+    page = Image.new("RGB", layer.size, (255, 255, 255))
+    # Exports read each layer once, so don't keep rendered ops around
+    for img, pos in layer.regions(keep=False):
+        if img.mode == "RGBA":
+            page.paste(img.convert("RGB"), pos, mask=img.getchannel("A"))
+        else:
+            page.paste(img.convert("RGB"), pos)
+    return page
+
+def flatten(img):
+    """Flattens an image onto white paper as RGB."""
+    # Handle RGBA -> RGB conversion by pasting on white background
+    # This ensures any transparency becomes white paper, not black artifacts
+    if img.mode == 'RGBA':
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        # Paste the image using its own alpha channel as the mask
+        background.paste(img, mask=img.split()[3])
+        return background
+    return img.convert("RGB")
+
+class Cancelled(Exception):
+    """Raised when a long operation is cancelled part way through."""
+
+# Encoded page data held in memory before an export is flushed to disk
+PDF_FLUSH_BYTES = 64 * 1024 * 1024
+# Pages flattened and encoded ahead of the one being written; each is held in memory until then
+PDF_ENCODE_AHEAD = 3
+# Largest difference between RGB channels for a page to be stored as grayscale
+GRAY_TOLERANCE = 4
+
+@dataclass
+class PdfExportSettings:
+    """
+    How save_layers_to_pdf embeds flattened pages. encoding is "JPEG" (lossy,
+    at quality) or "Flate" (lossless). Pages are downsampled to dpi if that
+    is below PDF_DPI; grayscale stores pages whose colour channels (nearly)
+    match with one channel. Identical page images are always stored once.
+    """
+    encoding: str = "JPEG"
+    quality: int = 75
+    dpi: int = PDF_DPI
+    grayscale: bool = True
+
+def is_grayscale(img, tolerance=GRAY_TOLERANCE):
+    """True if no pixel of an RGB image has channels more than tolerance apart."""
+    r, g, b = img.split()
+    return all(ImageChops.difference(x, y).getextrema()[1] <= tolerance for x, y in ((r, g), (g, b)))
+
+def _passthrough(layer):
+    return isinstance(layer, PdfLayer) and not layer.modified
+
+def _encode_page(layer, settings):
+    """
+    Flattens and encodes one page for embedding. Returns the page size in
+    points, the image digest, and either JPEG bytes or, for Flate, the image
+    itself, which MuPDF compresses on insertion.
+    """
+    size = tuple(v * 72 / PDF_DPI for v in layer.size)
+    if settings.dpi >= PDF_DPI:
+        img = flatten_layer(layer)
+    elif isinstance(layer, PdfLayer) and layer.tiles is None:
+        # Only ops changed: rasterize straight at the target dpi rather than downsampling
+        img = layer.source.render(layer.page_index, settings.dpi)
+        img = flatten(fuse(layer.ops)(img)) if layer.ops else img
+    else:
+        img = flatten_layer(layer)
+        scale = settings.dpi / PDF_DPI
+        # Hamming is about twice as fast as Lanczos and as clean when shrinking
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.Resampling.HAMMING, reducing_gap=2.0)
+    if settings.grayscale and is_grayscale(img):
+        img = img.convert("L")
+    digest = digest_image(img)
+    if settings.encoding == "Flate":
+        return size, digest, img
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=settings.quality)
+    return size, digest, buf.getvalue()
+
+@traced("save_layers_to_pdf", meta=lambda layers, path, *a, **k: {"layers": len(layers)})
+def save_layers_to_pdf(layers, path, progress=None, cancelled=None, settings=None):
+    """
+    Saves the visible layers as one multi-page PDF, with page images encoded
+    as settings (a PdfExportSettings) asks. progress(done, total) is called
+    after each page; if cancelled() returns True, Cancelled is raised and
+    path is left untouched.
+    """
+    import fitz
+    settings = settings or PdfExportSettings()
+    if settings.encoding not in ("JPEG", "Flate"):
+        raise ValueError(f"Unknown PDF image encoding: {settings.encoding}")
+    visible = [l for l in layers if l.visible]
+    if not visible:
         return
-    
-    base = visible_imgs[0]
-    rest = visible_imgs[1:]
-    base.save(path, save_all=True, append_images=rest, resolution=150.0)
\ No newline at end of file
+
+    out = fitz.open()
+    pending, on_disk = 0, False
+    stored = {}  # image digest -> xref
+    futures = {}
+    with atomic_write(path) as part:
+        try:
+            for i, l in enumerate(visible):
+                if cancelled and cancelled():
+                    raise Cancelled()
+                # Flatten and encode the next few pages on the worker pool while this one is written
+                for j in range(i, min(i + PDF_ENCODE_AHEAD + 1, len(visible))):
+                    if j not in futures and not _passthrough(visible[j]):
+                        futures[j] = worker_pool.submit(_encode_page, visible[j], settings)
+
+                if _passthrough(l):
+                    # Unedited PDF pages are copied as-is, keeping their vector content
+                    with l.source.lock:
+                        out.insert_pdf(l.source.doc, from_page=l.page_index, to_page=l.page_index)
+                else:
+                    (w, h), digest, data = futures.pop(i).result()
+                    page = out.new_page(width=w, height=h)
+                    if digest in stored:
+                        # Repeated page images reference one stored copy; MuPDF only
+                        # merges identical streams within one save, not across flushes
+                        page.insert_image(page.rect, xref=stored[digest])
+                    else:
+                        if isinstance(data, Image.Image):
+                            cs = fitz.csGRAY if data.mode == "L" else fitz.csRGB
+                            xref = page.insert_image(page.rect, pixmap=fitz.Pixmap(
+                                cs, data.width, data.height, data.tobytes(), False))
+                            pending += data.width * data.height * len(data.getbands())
+                        else:
+                            xref = page.insert_image(page.rect, stream=data)
+                            pending += len(data)
+                        stored[digest] = xref
+                    del data
+
+                # Flush with incremental saves, so memory stays flat however long the document is
+                if pending > PDF_FLUSH_BYTES:
+                    _write_pdf(out, part, on_disk)
+                    out.close()
+                    out = fitz.open(part)
+                    pending, on_disk = 0, True
+
+                if progress:
+                    progress(i + 1, len(visible))
+
+            # Duplicate objects from copied pages only merge if the file is written in one go
+            _write_pdf(out, part, on_disk)
+            out.close()
+        except BaseException:
+            for fut in futures.values():
+                fut.cancel()
+            out.close()
+            raise
+
+def _write_pdf(out, path, on_disk):
+    if on_disk:
+        out.saveIncr()
+    else:
+        # garbage=4 also merges objects and streams with identical content
+        out.save(path, garbage=4, deflate=True)
+
+# Encoder name -> file extension
+ENCODERS = {
+    "PNG": ".png",
+    "PNG (fast lossless)": ".png",
+    "JPEG": ".jpg",
+    "WebP": ".webp",
+    "WebP (lossless)": ".webp",
+}
+
+@dataclass
+class ExportSettings:
+    """How exported images are encoded. quality applies to JPEG and WebP, compression to PNG (0-9)."""
+    encoder: str = "PNG"
+    quality: int = 90
+    compression: int = 6
+
+    @property
+    def ext(self):
+        return ENCODERS[self.encoder]
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """
+    Yields a temporary path next to path to write to instead. It replaces
+    path once the block succeeds and is deleted if it fails, so a failed or
+    cancelled save never leaves path partly written.
+    """
+    part = path + ".part"
+    try:
+        yield part
+        os.replace(part, path)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+
+@traced("save_image", meta=lambda img, path, settings=None: {
+    "size": size_of(img), "encoder": settings.encoder if settings else "PNG"})
+def save_image(img, path, settings=None):
+    """
+    Encodes an image to path with the given ExportSettings, through atomic_write.
+    """
+    settings = settings or ExportSettings()
+    if settings.encoder == "PNG":
+        fmt, params = "PNG", dict(compress_level=settings.compression)
+    elif settings.encoder == "PNG (fast lossless)":
+        fmt, params = "PNG", dict(compress_level=1)
+    elif settings.encoder == "JPEG":
+        # No alpha in JPEG; transparency becomes white, as in PDF export
+        fmt, params, img = "JPEG", dict(quality=settings.quality), flatten(img)
+    elif settings.encoder == "WebP":
+        fmt, params = "WEBP", dict(quality=settings.quality, method=4)
+    elif settings.encoder == "WebP (lossless)":
+        # method 0 is libwebp's fastest lossless search; colour under fully transparent pixels is dropped
+        fmt, params = "WEBP", dict(lossless=True, quality=settings.quality, method=0)
+    else:
+        raise ValueError(f"Unknown encoder: {settings.encoder}")
+
+    with atomic_write(path) as part:
+        img.save(part, fmt, **params)
+
+def export_names(layers, ext):
+    """File names for layers, from their names, suffixing ones that would collide."""
+    taken, names = set(), []
+    for l in layers:
+        stem = "".join("_" if c in '\\/:*?"<>|' else c for c in l.name).strip() or "layer"
+        name, n = stem + ext, 1
+        while name.lower() in taken:
+            n += 1
+            name = f"{stem}_{n}{ext}"
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+@traced("export_layers", meta=lambda layers, directory, *a, **k: {"layers": len(layers)})
+def export_layers(layers, directory, settings=None, progress=None, cancelled=None):
+    """
+    Saves every layer as its own file in directory, named after the layer,
+    decoding and encoding several at once. Returns the paths written.
+
+    progress(done, total) is called as files finish. If cancelled() returns
+    True, layers not yet started are skipped and Cancelled is raised.
+    """
+    settings = settings or ExportSettings()
+    paths = [os.path.join(directory, n) for n in export_names(layers, settings.ext)]
+    futures = [worker_pool.submit(lambda l, p: save_image(l.pixels(keep=False).to_image(), p, settings), l, p)
+               for l, p in zip(layers, paths)]
+    try:
+        for done, fut in enumerate(as_completed(futures), 1):
+            fut.result()
+            if cancelled and cancelled():
+                raise Cancelled()
+            if progress:
+                progress(done, len(futures))
+    finally:
+        for fut in futures:
+            fut.cancel()
+    return paths
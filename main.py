@@ -1,5 +1,10 @@
+import time
+# Measured from here; see MainWindow.startup_done
+START = time.perf_counter()
+
 import sys
 import os
+from collections import deque
 
 if "QT_PLUGIN_PATH" not in os.environ:
     # In a pixi env, python is in <env>/bin, plugins are in <env>/lib/qt6/plugins
@@ -8,22 +13,28 @@ if "QT_PLUGIN_PATH" not in os.environ:
     if os.path.exists(plugin_path):
         os.environ["QT_PLUGIN_PATH"] = plugin_path
 
-from PIL import Image
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-    QListWidget, QPushButton, QFileDialog, QMessageBox, QSplitter, 
-    QFrame, QAbstractItemView, QInputDialog, QListWidgetItem, QProgressDialog,
-    QLabel, QTabWidget
+    QListView, QPushButton, QFileDialog, QMessageBox, QSplitter, 
+    QFrame, QAbstractItemView, QInputDialog,
+    QLabel, QTabWidget, QDockWidget
 )
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QColor, QIcon
+from PyQt6.QtCore import Qt, QTimer, QMetaObject
+from PyQt6.QtGui import QColor, QIcon, QKeySequence, QShortcut
 
 #  Import our custom modules
-from ui import LayerWidget, CheckerLabel, CompareDialog
+from ui import LayerModel, LayerDelegate, CheckerLabel, CompareDialog, ExportDialog, PdfExportDialog, JobStatus, StatsPanel
+from jobs import JobScheduler
 from logic import (
-    Layer, Worker, to_alpha, invert_color, composite_layers, remove, 
-    load_pdf_layers, save_layers_to_pdf
+    import_images, to_alpha, invert_color, composite_layers, remove, import_rembg, warm_up,
+    import_pdf, save_layers_to_pdf, save_image, export_layers, ExportSettings, PdfExportSettings, Cancelled
 )
+from compositor import CompositeCache
+from history import History
+from project import PROJECT_EXT, load_project, save_project
+from profiling import profiler, traced, size_of
+
+IMPORTED = time.perf_counter()
 
 class OrderedFileDialog(QFileDialog):
     def __init__(self, parent=None, caption="", directory="", filter=""):
@@ -69,8 +80,9 @@ class EditorBase(QWidget):
     Base class containing the List + Preview UI pattern.
     Subclasses define specific buttons and processing logic.
     """
-    def __init__(self, parent=None):
+    def __init__(self, scheduler, parent=None):
         super().__init__(parent)
+        self.scheduler = scheduler
         self.setup_ui()
 
     def setup_ui(self):
@@ -81,11 +93,19 @@ class EditorBase(QWidget):
         self.btns_top = QHBoxLayout()
         left_layout.addLayout(self.btns_top)
         
-        self.list = QListWidget()
-        self.list.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
-        self.list.itemClicked.connect(self.refresh)
-        self.list.itemDoubleClicked.connect(self.rename)
+        # Rows are painted by the delegate, so only visible ones cost anything
+        self.model = LayerModel(self.scheduler, self)
+        self.list = QListView()
+        self.list.setModel(self.model)
+        self.list.setItemDelegate(LayerDelegate(self.handle_list_action, self.list))
+        self.list.setUniformItemSizes(True)
+        self.list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.list.clicked.connect(lambda *_: self.refresh())
+        self.list.doubleClicked.connect(self.rename)
         self.list.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.list.setDefaultDropAction(Qt.DropAction.MoveAction)
+        # Drag-and-drop reorders change the stack just like the up/down buttons
+        self.model.rowsMoved.connect(lambda *_: self.refresh())
         left_layout.addWidget(self.list)
 
         # Placeholder for specific controls (Effects, etc)
@@ -124,60 +144,75 @@ class EditorBase(QWidget):
             b.setStyleSheet(f"background-color: {bg}; font-weight: bold;")
         layout.addWidget(b)
 
+    def preview_size(self):
+        """Size of the preview area in device pixels."""
+        dpr = self.preview.devicePixelRatioF()
+        return int(self.preview.width() * dpr), int(self.preview.height() * dpr)
+
+    def refresh_meta(self, node):
+        """Profiling metadata for refresh: the size of the layer shown, if any, and the preview box."""
+        return {"layer": size_of(node) if node else None, "box": self.preview_size()}
+
     def get_node(self):
-        item = self.list.currentItem()
-        return item.data(Qt.ItemDataRole.UserRole) if item else None
+        index = self.list.currentIndex()
+        return index.data(Qt.ItemDataRole.UserRole) if index.isValid() else None
     
+    def has_selection(self):
+        return self.list.selectionModel().hasSelection()
+
+    def get_selected_nodes(self):
+        rows = sorted(i.row() for i in self.list.selectionModel().selectedRows())
+        nodes = [self.model.layers[r] for r in rows]
+        return nodes or ([self.get_node()] if self.get_node() else [])
+
     def get_all_nodes(self):
-        return [self.list.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.list.count())]
+        return list(self.model.layers)
 
     def add_layer_to_list(self, layer):
-        item = QListWidgetItem()
-        item.setData(Qt.ItemDataRole.UserRole, layer)
-        self.list.addItem(item)
-        widget = LayerWidget(item, self.handle_list_action)
-        item.setSizeHint(widget.sizeHint())
-        self.list.setItemWidget(item, widget)
-
-    def handle_list_action(self, action, item):
-        row = self.list.row(item)
-        node = item.data(Qt.ItemDataRole.UserRole)
+        self.add_layers_to_list([layer])
+
+    def add_layers_to_list(self, layers):
+        self.model.append(layers)
+
+    def set_layers(self, layers):
+        self.model.reset(layers)
+        self.refresh()
+
+    def handle_list_action(self, action, row):
+        node = self.model.layers[row]
         
         if action == 'vis':
             node.visible = not node.visible
-        elif action == 'up' and row > 0:
-            self.list.takeItem(row)
-            self.list.insertItem(row - 1, item)
-            self.list.setItemWidget(item, LayerWidget(item, self.handle_list_action))
-            self.list.setCurrentRow(row - 1)
-        elif action == 'down' and row < self.list.count() - 1:
-            self.list.takeItem(row)
-            self.list.insertItem(row + 1, item)
-            self.list.setItemWidget(item, LayerWidget(item, self.handle_list_action))
-            self.list.setCurrentRow(row + 1)
-        
-        self.refresh()
+            self.model.update([node])
+            self.refresh()
+        elif action in ('up', 'down'):
+            # The current row and selection follow the moved layer; rowsMoved refreshes
+            self.model.move(row, row - 1 if action == 'up' else row + 1)
+            self.list.setCurrentIndex(self.model.index(self.model.row(node)))
 
     def del_img(self):
-        row = self.list.currentRow()
+        row = self.list.currentIndex().row()
         if row >= 0:
-            self.list.takeItem(row)
+            self.model.remove(row)
             self.refresh()
 
-    def rename(self, item):
-        node = item.data(Qt.ItemDataRole.UserRole)
+    def rename(self, index):
+        node = index.data(Qt.ItemDataRole.UserRole)
         name, ok = QInputDialog.getText(self, "Rename", "Name:", text=node.name)
         if ok and name:
             node.name = name
-            self.list.setItemWidget(item, LayerWidget(item, self.handle_list_action))
+            self.model.update([node])
 
     def refresh(self):
         # To be implemented by subclasses
         pass
 
 class ImageEditor(EditorBase):
-    def __init__(self):
-        super().__init__()
+    # Concurrent rembg inferences; each one already uses several cores
+    BG_THREADS = 2
+
+    def __init__(self, scheduler):
+        super().__init__(scheduler)
         # Top Buttons
         self.add_btn("Import Images", self.load_img, self.btns_top)
         self.add_btn("Remove", self.del_img, self.btns_top)
@@ -187,69 +222,191 @@ class ImageEditor(EditorBase):
         self.add_btn("Greyscale -> Alpha", lambda: self.apply(to_alpha), self.controls_layout)
         self.add_btn("Invert Colors", lambda: self.apply(invert_color), self.controls_layout)
         self.add_btn("Remove Background", self.bg_remove_flow, self.controls_layout)
+        history_row = QHBoxLayout()
+        self.controls_layout.addLayout(history_row)
+        self.add_btn("Undo", self.undo, history_row)
+        self.add_btn("Redo", self.redo, history_row)
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.undo)
+        QShortcut(QKeySequence.StandardKey.Redo, self, self.redo)
         
         # Bottom Buttons
         self.add_btn("View Composite", self.show_composite, self.btns_bottom)
-        self.add_btn("Export Composite", self.export, self.btns_bottom, "#2a82da")
+        self.add_btn("Export...", self.export, self.btns_bottom, "#2a82da")
         
         self.comp_img = None
+        self.comp_cache = CompositeCache()
+        self.history = History()
+        self.export_settings = ExportSettings()
+        self.pending_bg = deque()
+        self.confirming = False
+        self.scheduler.set_limit("rembg", self.BG_THREADS)
 
     def load_img(self):
         paths = get_ordered_open_file_names(self, "Import Images", "", "Images (*.png *.jpg *.jpeg)")
-        for p in paths:
-            try:
-                self.add_layer_to_list(Layer(os.path.basename(p), Image.open(p)))
-            except Exception as e:
-                QMessageBox.warning(self, "Error", str(e))
+        if not paths: return
+        # Files decode in parallel, at preview resolution, and are added in the order picked
+        self.scheduler.submit(
+            import_images, paths, self.preview_size(), key=(self, "import"), report=True,
+            label=f"Import {len(paths)} image(s)", on_partial=self.add_layers_to_list,
+            on_done=self.report_failed,
+            on_error=lambda e: QMessageBox.critical(self, "Error", e))
+
+    def report_failed(self, failed):
+        if failed:
+            QMessageBox.warning(self, "Error", "\n".join(f"{os.path.basename(p)}: {e}" for p, e in failed))
 
     def apply(self, func):
-        node = self.get_node()
-        if node:
-            node.img = func(node.img)
-            self.refresh()
+        # Recorded on every selected layer at once; the fused chain runs when pixels are next needed
+        nodes = self.get_selected_nodes()
+        if not nodes: return
+        self.history.add_op(nodes, func)
+        self.model.update(nodes)
+        self.refresh()
+
+    def remove_bg(self, node):
+        # Snapshot the input so the comparison shows exactly what was processed
+        base, ops, version = node.tiles, node.ops, node.version
+        before = node.img
+        new_img = remove(before)
+        return before, new_img, self.history.prepare(node, base, new_img, ops, version)
 
     def bg_remove_flow(self):
-        node = self.get_node()
-        if not node: return
-        
-        pd = QProgressDialog("Processing...", None, 0, 0, self)
-        pd.show()
-        
-        self.worker = Worker(remove, node.img)
-        self.worker.finished.connect(lambda res: (pd.close(), self.confirm_bg(node, res)))
-        self.worker.error.connect(lambda e: (pd.close(), QMessageBox.critical(self, "Error", e)))
-        self.worker.start()
-
-    def confirm_bg(self, node, new_img):
-        if CompareDialog(self, node.img, new_img).exec():
-            node.img = new_img
+        try:
+            import_rembg()  # Here rather than on the pool thread; see import_rembg
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Background removal is unavailable: {e}")
+            return
+        for node in self.get_selected_nodes():
+            self.scheduler.submit(
+                self.remove_bg, node, key=node, group="rembg", label=f"Remove background: {node.name}",
+                on_done=lambda res: self.queue_bg(*res),
+                on_error=lambda e, n=node: QMessageBox.critical(self, "Error", f"{n.name}: {e}"))
+
+    def queue_bg(self, before, new_img, pending):
+        # Results can land while a dialog is open, so confirm them one at a time
+        self.pending_bg.append((before, new_img, pending))
+        if self.confirming: return
+        self.confirming = True
+        while self.pending_bg:
+            self.confirm_bg(*self.pending_bg.popleft())
+        self.confirming = False
+
+    def confirm_bg(self, before, new_img, pending):
+        if not any(n is pending.layer for n in self.get_all_nodes()): return
+        if CompareDialog(self, before, new_img).exec():
+            self.commit(pending)
+
+    def commit(self, pending):
+        self.history.commit(pending)
+        self.model.update([pending.layer])
+        self.refresh()
+
+    def undo(self):
+        layers = self.history.undo()
+        if layers:
+            self.model.update(layers)
             self.refresh()
 
+    def redo(self):
+        layers = self.history.redo()
+        if layers:
+            self.model.update(layers)
+            self.refresh()
+
+    def set_layers(self, layers):
+        # Edits of the previous layers can't be undone into the new ones
+        self.history.clear()
+        self.comp_img = None
+        super().set_layers(layers)
+
+    def del_img(self):
+        node = self.get_node()
+        super().del_img()
+        if node and not any(n is node for n in self.get_all_nodes()):
+            self.history.forget(node)
+
     def show_composite(self):
-        layers = self.get_all_nodes()
-        self.comp_img = composite_layers(layers)
-        self.preview.set_image(self.comp_img)
         self.list.clearSelection()
-
+        # Only the latest request matters while layers are changing quickly
+        self.scheduler.submit(
+            composite_layers, self.get_all_nodes(), self.comp_cache,
+            key=(self, "composite"), coalesce=True, label="Composite",
+            on_done=self.set_composite,
+            on_error=lambda e: QMessageBox.critical(self, "Error", e))
+
+    def set_composite(self, img):
+        self.comp_img = img
+        if not self.has_selection():
+            self.preview.set_image(img)
+
+    @traced("ImageEditor.refresh", cat="ui", meta=lambda self: self.refresh_meta(
+        self.get_node() if self.has_selection() else None))
     def refresh(self):
-        if self.list.selectedItems():
-            self.preview.set_image(self.get_node().display)
+        node = self.get_node()
+        if node and self.has_selection():
+            box = self.preview_size()
+            # Versions are unique across layers, so this names the exact pixels shown
+            key = ("preview", node.version, box)
+            if not self.preview.show_cached(key):
+                # Decoding or running ops can take a while; only the latest selection needs it
+                self.scheduler.submit(
+                    node.preview, box, key=(self, "preview"), coalesce=True,
+                    label=f"Preview {node.name}",
+                    on_done=lambda img: self.has_selection() and self.get_node() is node
+                    and self.preview.set_image(img, key),
+                    on_error=lambda e: QMessageBox.critical(self, "Error", e))
         else:
             self.show_composite()
 
     def export(self):
-        img = self.comp_img
-        if self.list.selectedItems():
-            img = self.get_node().display
-        if not img: return
-            
-        path, _ = QFileDialog.getSaveFileName(self, "Save", "composite.png", "*.png")
-        if path:
-            img.save(path)
+        layers = self.get_all_nodes()
+        if not layers: return
+        node = self.get_node() if self.has_selection() else None
+        scopes = [("composite", "Composite")]
+        if node:
+            scopes.append(("layer", f"Selected layer ({node.name})"))
+        scopes += [("visible", "Every visible layer, one file each"), ("all", "Every layer, one file each")]
+        dlg = ExportDialog(self, scopes, self.export_settings)
+        if not dlg.exec(): return
+        settings = self.export_settings = dlg.settings()
+        scope = dlg.selected_scope()
+        
+        if scope in ("visible", "all"):
+            if scope == "visible":
+                layers = [l for l in layers if l.visible]
+            directory = QFileDialog.getExistingDirectory(self, "Export Layers To")
+            if not directory: return
+            self.scheduler.submit(
+                export_layers, layers, directory, settings, report=True,
+                label=f"Export {len(layers)} layer(s)",
+                on_done=lambda paths: self.window().statusBar().showMessage(
+                    f"Exported {len(paths)} file(s) to {directory}", 5000),
+                on_error=lambda e: QMessageBox.critical(self, "Error Exporting", e))
+            return
+        
+        name = node.name if scope == "layer" else "composite"
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save", os.path.splitext(name)[0] + settings.ext, f"*{settings.ext}")
+        if not path: return
+        cache = self.comp_cache
+        
+        def encode(progress, cancelled):
+            # Composites with the shared cache, so an unchanged stack isn't blended again
+            img = node.img if scope == "layer" else composite_layers(layers, cache)
+            if cancelled():
+                raise Cancelled()
+            progress(1, 2)
+            save_image(img, path, settings)
+            progress(2, 2)
+        
+        self.scheduler.submit(
+            encode, report=True, label=f"Export {os.path.basename(path)}",
+            on_done=lambda _: self.window().statusBar().showMessage(f"Saved {path}", 5000),
+            on_error=lambda e: QMessageBox.critical(self, "Error Exporting", e))
 
 class PdfEditor(EditorBase):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, scheduler):
+        super().__init__(scheduler)
         # Top Buttons
         self.add_btn("Import PDF", self.load_pdf, self.btns_top)
         self.add_btn("Remove Page", self.del_img, self.btns_top)
@@ -257,6 +414,7 @@ class PdfEditor(EditorBase):
         # Bottom Buttons
         self.controls_layout.addStretch() # Push export to bottom
         self.add_btn("Export Combined PDF", self.export, self.btns_bottom, "#2a82da")
+        self.export_settings = PdfExportSettings()
 
     def load_pdf(self):
         paths = get_ordered_open_file_names(self, "Import PDFs", "", "PDF Files (*.pdf)")
@@ -276,34 +434,50 @@ class PdfEditor(EditorBase):
         
         current_pdf_idx = max_pdf_idx + 1
 
+        # One job per file under one key, so files are added in the order picked;
+        # pages appear chunk by chunk while the rest are still rendering
         for path in paths:
-            try:
-                layers = load_pdf_layers(path, pdf_index=current_pdf_idx)
-                for l in layers:
-                    self.add_layer_to_list(l)
-                current_pdf_idx += 1
-            except Exception as e:
-                QMessageBox.critical(self, "Error importing PDF", f"{path}:\n{str(e)}")
-
+            self.scheduler.submit(
+                import_pdf, path, current_pdf_idx, self.preview_size(), key=(self, "import"),
+                report=True, label=f"Import {os.path.basename(path)}",
+                on_partial=self.add_layers_to_list,
+                on_error=lambda e, path=path: QMessageBox.critical(
+                    self, "Error importing PDF", f"{path}:\n{e}"))
+            current_pdf_idx += 1
+
+    @traced("PdfEditor.refresh", cat="ui", meta=lambda self: self.refresh_meta(self.get_node()))
     def refresh(self):
         # For PDF, we just show the selected page. There is no 'composite' view.
         node = self.get_node()
-        if node:
-            self.preview.set_image(node.display)
-        else:
+        if not node:
             self.preview.set_image(None)
+            return
+        box = self.preview_size()
+        key = ("preview", node.version, box)
+        if self.preview.show_cached(key):
+            return
+        # Rendering a page can take a while; only the latest selection needs it
+        self.scheduler.submit(
+            node.preview, box, key=(self, "preview"), coalesce=True,
+            label=f"Render {node.name}",
+            on_done=lambda img: self.get_node() is node and self.preview.set_image(img, key))
 
     def export(self):
         layers = self.get_all_nodes()
         if not layers: return
         
+        dlg = PdfExportDialog(self, self.export_settings)
+        if not dlg.exec(): return
+        settings = self.export_settings = dlg.settings()
+        
         path, _ = QFileDialog.getSaveFileName(self, "Save PDF", "combined.pdf", "*.pdf")
-        if path:
-            try:
-                save_layers_to_pdf(layers, path)
-                QMessageBox.information(self, "Success", "PDF Saved Successfully!")
-            except Exception as e:
-                QMessageBox.critical(self, "Error Saving", str(e))
+        if not path: return
+        
+        self.scheduler.submit(
+            lambda progress, cancelled: save_layers_to_pdf(layers, path, progress, cancelled, settings),
+            report=True, label="Export PDF",
+            on_done=lambda _: QMessageBox.information(self, "Success", "PDF Saved Successfully!"),
+            on_error=lambda e: QMessageBox.critical(self, "Error Saving", e))
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -315,8 +489,107 @@ class MainWindow(QMainWindow):
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
         
-        self.tabs.addTab(ImageEditor(), "Image Compositor")
-        self.tabs.addTab(PdfEditor(), "PDF Tools")
+        # One scheduler, and thread pool, shared by both editors
+        self.scheduler = JobScheduler(parent=self)
+        self.statusBar().addPermanentWidget(JobStatus(self.scheduler))
+        
+        self.image_editor = ImageEditor(self.scheduler)
+        self.tabs.addTab(self.image_editor, "Image Compositor")
+        # Other tabs are built the first time they are selected
+        self.lazy_tabs = {}
+        self.pdf_page = self.add_lazy_tab(lambda: PdfEditor(self.scheduler), "PDF Tools")
+        self.tabs.currentChanged.connect(self.build_tab)
+        self.started = False
+        
+        # Per-operation timings, hidden until asked for
+        self.stats = QDockWidget("Profiler", self)
+        self.stats.setWidget(StatsPanel())
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.stats)
+        self.stats.hide()
+        files = self.menuBar().addMenu("File")
+        files.addAction("Open Project...", QKeySequence.StandardKey.Open, self.open_project)
+        files.addAction("Save Project...", QKeySequence.StandardKey.Save, self.save_project)
+        tools = self.menuBar().addMenu("Tools")
+        tools.addAction(self.stats.toggleViewAction())
+        tools.addAction("Export Trace...", self.stats.widget().export_trace)
+
+    def add_lazy_tab(self, factory, title):
+        page = QWidget()
+        layout = QVBoxLayout(page)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.lazy_tabs[page] = factory
+        self.tabs.addTab(page, title)
+        return page
+
+    def build_tab(self, index):
+        page = self.tabs.widget(index)
+        factory = self.lazy_tabs.pop(page, None)
+        if factory:
+            page.layout().addWidget(factory())
+
+    def pdf_editor(self, build=True):
+        """The PDF editor; None if its tab was never opened and build is False."""
+        if self.pdf_page in self.lazy_tabs:
+            if not build:
+                return None
+            self.build_tab(self.tabs.indexOf(self.pdf_page))
+        return self.pdf_page.layout().itemAt(0).widget()
+
+    def open_project(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open Project", "", f"Projects (*{PROJECT_EXT})")
+        if not path: return
+        try:
+            editors = load_project(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error opening project", f"{path}:\n{e}")
+            return
+        self.image_editor.set_layers(editors.get("images", []))
+        pages = editors.get("pages", [])
+        if pages or self.pdf_editor(build=False):
+            self.pdf_editor().set_layers(pages)
+        self.statusBar().showMessage(f"Opened {os.path.basename(path)}", 5000)
+
+    def save_project(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Project", f"project{PROJECT_EXT}",
+                                              f"Projects (*{PROJECT_EXT})")
+        if not path: return
+        pdf = self.pdf_editor(build=False)
+        editors = {"images": self.image_editor.get_all_nodes(),
+                   "pages": pdf.get_all_nodes() if pdf else []}
+        self.scheduler.submit(
+            save_project, path, editors, report=True, label="Save project",
+            on_done=lambda _: self.statusBar().showMessage(f"Saved {os.path.basename(path)}", 5000),
+            on_error=lambda e: QMessageBox.critical(self, "Error saving project", e))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.started:
+            self.started = True
+            # Runs once the first frame has been painted and the event loop is idle
+            QTimer.singleShot(0, self.startup_done)
+
+    def startup_done(self):
+        now = time.perf_counter()
+        profiler.record("startup imports", "startup", START, IMPORTED)
+        profiler.record("startup", "startup", START, now)
+        msg = f"Started in {(now - START) * 1e3:.0f} ms (imports {(IMPORTED - START) * 1e3:.0f} ms)"
+        self.statusBar().showMessage(msg, 5000)
+        if "--startup-time" in sys.argv:
+            print(msg)
+            QApplication.quit()
+            return
+        # Heavy libraries load now that the window is up; --quit-after-warm-up checks
+        # that the process still exits once they have
+        done = None
+        if "--quit-after-warm-up" in sys.argv:
+            done = lambda: QMetaObject.invokeMethod(QApplication.instance(), "quit",
+                                                    Qt.ConnectionType.QueuedConnection)
+        # Imports rembg on this thread, which blocks it for a moment; let the message paint first
+        QTimer.singleShot(0, lambda: warm_up(done=done))
+
+    def closeEvent(self, event):
+        self.scheduler.cancel_all()
+        super().closeEvent(event)
 
     def setStyle(self):
         QApplication.setStyle("Fusion")
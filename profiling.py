@@ -0,0 +1,129 @@
+"""
+Lightweight instrumentation for operations, jobs and painting.
+
+Wrap work in ``span(name, **args)`` or decorate it with ``@traced``. Every
+span is recorded on the global ``profiler`` as a Chrome trace "complete"
+event (viewable in chrome://tracing or Perfetto) and folded into live
+per-name statistics. Spans nest per thread and cost a couple of
+microseconds, so they are always on; the event log is bounded.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class OpStats:
+    __slots__ = ("calls", "total", "max", "last")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = self.max = self.last = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+
+class Profiler:
+    """Collects timed spans from any thread. Keeps the latest max_events for trace export."""
+    def __init__(self, max_events=200_000):
+        self.events = deque(maxlen=max_events)
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._threads = {}
+
+    def record(self, name, cat, start, end, args=None):
+        """Adds a finished span; start and end are time.perf_counter() values."""
+        thread = threading.current_thread()
+        event = {
+            "name": name, "cat": cat, "ph": "X",
+            "ts": (start - self._origin) * 1e6, "dur": (end - start) * 1e6,
+            "pid": os.getpid(), "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+            self._threads[thread.ident] = thread.name
+            s = self.stats.get(name)
+            if s is None:
+                s = self.stats[name] = OpStats()
+            s.calls += 1
+            s.last = end - start
+            s.total += s.last
+            s.max = max(s.max, s.last)
+
+    def snapshot(self):
+        """(name, OpStats copy) pairs, slowest total first."""
+        with self._lock:
+            rows = []
+            for name, s in self.stats.items():
+                copy = OpStats()
+                copy.calls, copy.total, copy.max, copy.last = s.calls, s.total, s.max, s.last
+                rows.append((name, copy))
+        return sorted(rows, key=lambda r: r[1].total, reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.stats.clear()
+
+    def export_chrome_trace(self, path):
+        """Writes the recorded spans as Chrome trace-format JSON."""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        pid = os.getpid()
+        meta = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                for tid, name in threads.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f)
+
+profiler = Profiler()
+
+
+@contextmanager
+def span(name, cat="op", **args):
+    """Times the block as one span. args are shown with the event in the trace viewer."""
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        profiler.record(name, cat, start, time.perf_counter(), args)
+
+
+def traced(name=None, cat="op", meta=None):
+    """
+    Decorator form of span. meta(*args, **kwargs) may return a dict of
+    extra arguments, such as image sizes, to attach to each event.
+    """
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            extra = {}
+            if meta:
+                try:
+                    extra = meta(*args, **kwargs)
+                except Exception:
+                    pass  # Metadata is best-effort; never break the call for it
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(label, cat, start, time.perf_counter(), extra)
+        return wrapper
+    return decorate
+
+
+def size_of(img):
+    """Best-effort "WxH" for a PIL image, QImage, TiledImage or layer."""
+    size = img.size() if callable(getattr(img, "size", None)) else img.size
+    w, h = (size.width(), size.height()) if hasattr(size, "width") else size
+    return f"{w}x{h}"
@@ -0,0 +1,173 @@
+"""
+Project files: a workspace saved for reopening later.
+
+A project stores each editor's layers in order, with their names,
+visibility and pending ops, plus the pixels of every layer that has any.
+Pixels are kept as the zlib-compressed tiles TiledImage.pack produces, so
+opening a project maps the file and hands each layer views of its tiles;
+nothing is read or decompressed until a tile is first drawn. Unedited PDF
+pages and image files store no pixels, only a reference to their source
+file, which is opened again on load. Layers whose source has since
+disappeared are saved with their pixels instead, and an edited layer whose
+source is missing when the project is opened loads from its stored pixels.
+
+Layout: an 8-byte magic, the tile data, then a JSON index of the layers and
+their tile offsets; the file ends with the index's offset and length as two
+little-endian uint64s.
+"""
+import json
+import mmap
+import os
+import struct
+
+import logic
+from logic import Layer, FileLayer, PdfLayer, PdfSource, Cancelled, atomic_write
+from profiling import traced
+from tiles import TiledImage, worker_pool
+
+MAGIC = b"PMSPROJ1"
+PROJECT_EXT = ".pms"
+_TRAILER = struct.Struct("<QQ")
+
+
+class ProjectError(Exception):
+    """Raised for files that are not projects or reference missing sources."""
+
+
+@traced("save_project", meta=lambda path, editors, *a, **k: {
+    "layers": sum(len(v) for v in editors.values())})
+def save_project(path, editors, progress=None, cancelled=None):
+    """
+    Saves {editor name: layers} to path through atomic_write, so a failed
+    or cancelled save leaves the target untouched. Windows won't replace a
+    project that is open, since its tiles are mapped; that raises
+    ProjectError, and the project has to be saved under another name.
+
+    progress(done, total) is called after each layer. If cancelled() returns
+    True the partial file is discarded and Cancelled is raised.
+    """
+    total = sum(len(layers) for layers in editors.values())
+    base = os.path.dirname(os.path.abspath(path))
+    done = 0
+    try:
+        with atomic_write(path) as part, open(part, "wb") as f:
+            f.write(MAGIC)
+            index = {}
+            for editor, layers in editors.items():
+                entries = index[editor] = []
+                for layer in layers:
+                    if cancelled and cancelled():
+                        raise Cancelled()
+                    entries.append(_save_layer(f, layer, base))
+                    done += 1
+                    if progress:
+                        progress(done, total)
+            data = json.dumps({"version": 1, "editors": index}).encode()
+            offset = f.tell()
+            f.write(data)
+            f.write(_TRAILER.pack(offset, len(data)))
+    except PermissionError as e:
+        if e.filename2 is None:
+            raise
+        # Only the final replace names two files
+        raise ProjectError(f"Can't replace {path} while it is open; save under another name") from None
+
+
+def _save_layer(f, layer, base):
+    entry = {"name": layer.name, "visible": layer.visible, "ops": [op.__name__ for op in layer.ops]}
+    tiles = layer.tiles
+    source = layer.source.path if isinstance(layer, PdfLayer) else getattr(layer, "path", None)
+    if source and os.path.exists(source):
+        ref = {"path": _relpath(source, base), "abspath": os.path.abspath(source)}
+        if isinstance(layer, PdfLayer):
+            entry["pdf"] = dict(ref, page=layer.page_index)
+        else:
+            entry["file"] = ref
+    elif tiles is None:
+        # Keep the pixels, if they were decoded before the source went away
+        try:
+            tiles = layer.base_tiles(keep=False)
+        except FileNotFoundError as e:
+            raise ProjectError(str(e)) from None
+    if tiles is not None:
+        indexes = [i for i, _ in tiles.boxes()]
+        refs = []
+        for i, data in zip(indexes, worker_pool.map(tiles.pack, indexes)):
+            if data is not None:
+                refs.append((i, f.tell(), len(data)))
+                f.write(data)
+        entry["pixels"] = {"size": list(tiles.size), "mode": tiles.mode, "tiles": refs}
+    return entry
+
+
+def _relpath(path, base):
+    try:
+        return os.path.relpath(path, base)
+    except ValueError:
+        return os.path.abspath(path)  # Different drive on Windows
+
+
+@traced("load_project", meta=lambda path: {"file": os.path.basename(path)})
+def load_project(path):
+    """
+    Opens a project and returns {editor name: layers}. The file stays mapped
+    for as long as any of its tiles are in use.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ProjectError(f"Not a project file: {path}") from None
+    if len(mm) < len(MAGIC) + _TRAILER.size or mm[:len(MAGIC)] != MAGIC:
+        raise ProjectError(f"Not a project file: {path}")
+    offset, length = _TRAILER.unpack(mm[-_TRAILER.size:])
+    index = json.loads(mm[offset:offset + length])
+
+    view = memoryview(mm)
+    base = os.path.dirname(os.path.abspath(path))
+    sources = {}
+    return {editor: [_load_layer(entry, view, base, sources) for entry in entries]
+            for editor, entries in index["editors"].items()}
+
+
+def _load_layer(entry, view, base, sources):
+    tiles = None
+    pixels = entry.get("pixels")
+    if pixels:
+        packed = {i: view[offset:offset + length] for i, offset, length in pixels["tiles"]}
+        tiles = TiledImage.from_packed(tuple(pixels["size"]), pixels["mode"], packed)
+
+    pdf, file = entry.get("pdf"), entry.get("file")
+    ref = pdf or file
+    path = _find(ref, base) if ref else None
+    if ref and path is None and tiles is None:
+        raise ProjectError(f"Source file not found: {ref['abspath']}")
+    if path is None:
+        # No source, or a missing one whose layer was edited: its pixels are all stored
+        layer = Layer(entry["name"], tiles, entry["visible"])
+    elif pdf:
+        if path not in sources:
+            sources[path] = PdfSource(path)
+        layer = PdfLayer(entry["name"], sources[path], pdf["page"], entry["visible"])
+    else:
+        layer = FileLayer(entry["name"], path, entry["visible"])
+    if path is not None and tiles is not None:
+        layer.img = tiles
+    layer.ops = tuple(_effect(name) for name in entry["ops"])
+    return layer
+
+
+def _find(ref, base):
+    # Next to the project first, so a folder moved as a whole still opens
+    for path in (os.path.join(base, ref["path"]), ref["abspath"]):
+        path = os.path.normpath(path)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _effect(name):
+    effect = getattr(logic, name, None)
+    if not hasattr(effect, "kernel"):
+        raise ProjectError(f"Unknown effect: {name}")
+    return effect
@@ -0,0 +1,213 @@
+"""
+Persistent cache of expensive results: rembg cut-outs and PDF page renders.
+
+Entries are content-addressed: the key hashes the operation, its parameters
+and a digest of the input (its pixels, or the bytes of the source file), so
+the same work is never repeated across runs, and editing an input simply
+misses. Results are stored as PNG files under one directory per operation,
+written on a background thread so a miss costs no more than before. Once
+the files exceed max_bytes the least recently used ones are deleted.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from profiling import span
+
+
+def default_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pro-media-studio")
+
+
+def digest_image(img):
+    """Digest of an image's mode, size and pixels."""
+    h = hashlib.blake2b(f"{img.mode} {img.size}".encode(), digest_size=20)
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+def digest_file(path):
+    """Digest of a file's bytes, remembered until the file's size or mtime changes."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _file_digests_lock:
+        if key in _file_digests:
+            return _file_digests[key]
+    with span("digest file", file=os.path.basename(path), bytes=st.st_size), open(path, "rb") as f:
+        digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=20)).hexdigest()
+    with _file_digests_lock:
+        _file_digests[key] = digest
+    return digest
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = self.misses = 0
+
+
+class ResultCache:
+    """
+    Images on disk keyed by key(op, digest, **params). Safe to use from any
+    thread. Statistics count this process's lookups per operation.
+    """
+    def __init__(self, directory=None, max_bytes=2 * 1024 * 1024 * 1024):
+        self.directory = directory or os.environ.get("PMS_CACHE_DIR") or default_dir()
+        self.max_bytes = max_bytes
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._files = None  # path -> (last use, size), scanned on first use
+        self._bytes = 0
+        self._writer = ThreadPoolExecutor(1)
+
+    @staticmethod
+    def key(op, digest, **params):
+        """Cache key for op applied to the input with the given digest."""
+        blob = json.dumps([digest, params], sort_keys=True).encode()
+        return f"{op}/{hashlib.blake2b(blob, digest_size=20).hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".png")
+
+    def _scan(self):
+        # Called with the lock held
+        if self._files is not None:
+            return
+        self._files, self._bytes = {}, 0
+        if not os.path.isdir(self.directory):
+            return
+        for op in os.scandir(self.directory):
+            if not op.is_dir():
+                continue
+            for entry in os.scandir(op.path):
+                if entry.name.endswith(".png"):
+                    st = entry.stat()
+                    self._files[entry.path] = (st.st_mtime, st.st_size)
+                    self._bytes += st.st_size
+
+    def _count(self, key, hit):
+        s = self.stats.setdefault(key.split("/")[0], CacheStats())
+        if hit:
+            s.hits += 1
+        else:
+            s.misses += 1
+
+    def get(self, key):
+        """The cached image, or None. A None key never hits."""
+        if key is None:
+            return None
+        path = self._path(key)
+        with self._lock:
+            self._scan()
+            known = path in self._files
+            if not known:
+                self._count(key, False)
+                return None
+        try:
+            with span("result cache read", cat="io", key=key):
+                img = Image.open(path)
+                img.load()
+        except (OSError, ValueError):
+            self._drop(path)  # Deleted by another process, or a partial write
+            with self._lock:
+                self._count(key, False)
+            return None
+        with self._lock:
+            self._count(key, True)
+            if path in self._files:
+                self._files[path] = (time.time(), self._files[path][1])
+        try:
+            os.utime(path)  # Last use survives restarts
+        except OSError:
+            pass
+        return img
+
+    def put(self, key, img):
+        """Stores an image in the background; img must not be modified afterwards."""
+        if key is None:
+            return
+        self._writer.submit(self._write, key, img)
+
+    def _write(self, key, img):
+        path = self._path(key)
+        part = f"{path}.{os.getpid()}.part"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with span("result cache write", cat="io", key=key):
+                img.save(part, "PNG", compress_level=1)
+            os.replace(part, path)
+            size = os.path.getsize(path)
+        except OSError:
+            if os.path.exists(part):
+                os.remove(part)
+            return
+        with self._lock:
+            self._scan()
+            old = self._files.get(path)
+            self._bytes += size - (old[1] if old else 0)
+            self._files[path] = (time.time(), size)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Called with the lock held; trims to 90% so puts don't evict one file at a time
+        for path, (_, size) in sorted(self._files.items(), key=lambda e: e[1][0]):
+            if self._bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._files[path]
+            self._bytes -= size
+
+    def _drop(self, path):
+        with self._lock:
+            entry = self._files.pop(path, None) if self._files is not None else None
+            if entry:
+                self._bytes -= entry[1]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            self._scan()
+            return self._bytes
+
+    def summary(self):
+        """One line of hit rates per operation and the size on disk."""
+        with self._lock:
+            parts = [f"{op} {s.hits}/{s.hits + s.misses} hits" for op, s in sorted(self.stats.items())]
+        return ", ".join(parts + [f"{self.nbytes / 2**20:.0f} MiB on disk"])
+
+    def flush(self):
+        """Waits for pending writes."""
+        self._writer.submit(lambda: None).result()
+
+    def clear(self):
+        self.flush()
+        with self._lock:
+            self._scan()
+            for path in list(self._files):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._files.clear()
+            self._bytes = 0
+            self.stats.clear()
+
+result_cache = ResultCache()
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+from PIL import Image
+
+from compositor import CompositeCache, composite
+from conftest import noise, same
+from logic import Layer
+
+
+def baseline(layers):
+    """The original loop: every visible layer pasted onto a full-size canvas and blended."""
+    w = max(l.img.width for l in layers)
+    h = max(l.img.height for l in layers)
+    canvas = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    for l in layers:
+        if l.visible:
+            layer_canvas = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+            layer_canvas.paste(l.display, (0, 0))
+            canvas = Image.alpha_composite(canvas, layer_canvas)
+    return canvas
+
+
+def random_layer(rng, i):
+    size = (rng.randint(1, 700), rng.randint(1, 600))
+    mode = rng.choice(["RGB", "RGBA", "L"])
+    img = noise(size, mode, seed=rng.randrange(1 << 30))
+    if mode == "RGBA" and rng.random() < 0.5:
+        # Fully transparent margins, so only part of each tile is drawn
+        clear = Image.new("RGBA", size)
+        box = (size[0] // 4, size[1] // 3, size[0] // 2 + 1, size[1] // 2 + 1)
+        clear.paste(img.crop(box), box[:2])
+        img = clear
+    return Layer(str(i), img, visible=rng.random() < 0.8)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_matches_the_baseline_loop(seed):
+    rng = random.Random(seed)
+    layers = [random_layer(rng, i) for i in range(rng.randint(1, 6))]
+    assert same(composite(layers), baseline(layers))
+
+
+def test_all_hidden_is_transparent():
+    layers = [Layer("a", noise((300, 200)), visible=False), Layer("b", noise((100, 400), "RGBA"), visible=False)]
+    assert same(composite(layers), Image.new("RGBA", (300, 400)))
+
+
+def test_cache_matches_after_edits_and_toggles():
+    rng = random.Random(1)
+    layers = [random_layer(rng, i) for i in range(5)]
+    cache = CompositeCache()
+    assert same(cache.composite(layers), baseline(layers))
+    layers[2].img = noise(layers[2].size, "RGBA", seed=99)
+    assert same(cache.composite(layers), baseline(layers))
+    layers[1].visible = not layers[1].visible
+    assert same(cache.composite(layers), baseline(layers))
+    layers.insert(0, layers.pop())
+    assert same(cache.composite(layers), baseline(layers))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from conftest import noise, same
+from logic import Layer, fuse, invert_color, to_alpha
+
+
+# The implementations before effects became fused kernels
+def original_to_alpha(img):
+    arr = np.array(img.convert('L'))
+    h, w = arr.shape
+    rgba = np.zeros((h, w, 4), dtype=np.uint8)
+    rgba[..., 3] = 255 - arr
+    return Image.fromarray(rgba, 'RGBA')
+
+
+def original_invert_color(img):
+    if img.mode != 'RGBA':
+        return ImageOps.invert(img.convert('RGB')).convert('RGBA')
+    r, g, b, a = img.split()
+    return Image.merge('RGBA', (*ImageOps.invert(Image.merge('RGB', (r, g, b))).split(), a))
+
+
+ORIGINALS = {to_alpha: original_to_alpha, invert_color: original_invert_color}
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+@pytest.mark.parametrize("effect", [to_alpha, invert_color], ids=lambda e: e.__name__)
+def test_matches_the_original(effect, mode):
+    img = noise((301, 203), mode)
+    assert same(effect(img), ORIGINALS[effect](img))
+
+
+@pytest.mark.parametrize("chain", [
+    (invert_color, invert_color),
+    (invert_color, to_alpha),
+    (to_alpha, invert_color),
+    (to_alpha, invert_color, to_alpha),
+], ids=lambda c: "+".join(e.__name__ for e in c))
+def test_fused_chain_matches_applying_the_originals_in_turn(chain):
+    img = noise((257, 130), "RGBA")
+    expected = img
+    for effect in chain:
+        expected = ORIGINALS[effect](expected)
+    assert same(fuse(chain)(img), expected)
+
+
+def test_layer_ops_match_the_originals():
+    img = noise((600, 300))
+    layer = Layer("a", img)
+    layer.add_op(invert_color)
+    layer.add_op(to_alpha)
+    assert same(layer.img, original_to_alpha(original_invert_color(img)))
@@ -0,0 +1,124 @@
+from conftest import noise, same
+from history import History
+from logic import FileLayer, Layer, invert_color, to_alpha
+
+
+def edit(history, layer, img):
+    history.commit(history.prepare(layer, layer.tiles, img))
+
+
+def test_undo_and_redo_an_edit():
+    before, after = noise((600, 300)), noise((600, 300), seed=1)
+    layer = Layer("a", before)
+    version = layer.version
+    history = History()
+    edit(history, layer, after)
+
+    assert history.undo() == [layer]
+    assert same(layer.img, before) and layer.version == version
+    assert history.can_redo()
+    assert history.redo() == [layer]
+    assert same(layer.img, after)
+
+
+def test_ops_added_while_an_edit_runs_are_kept():
+    before = noise((300, 200))
+    layer = Layer("a", before)
+    history = History()
+    base, ops, version = layer.tiles, layer.ops, layer.version
+    history.add_op([layer], invert_color)  # While the edit is still computing
+    history.commit(history.prepare(layer, base, noise((300, 200), seed=1), ops, version))
+
+    assert layer.ops == (invert_color,)
+    assert same(layer.img, invert_color(noise((300, 200), seed=1)))
+    history.undo()
+    assert layer.ops == (invert_color,) and same(layer.tiles.to_image(), before)
+    history.undo()
+    assert layer.ops == () and same(layer.img, before)
+
+
+def test_only_changed_tiles_are_kept():
+    before = noise((1024, 256))
+    after = before.copy()
+    after.putpixel((300, 10), (0, 0, 0))
+    history = History()
+    edit(history, Layer("a", before), after)
+    (step,) = history._undo
+    assert list(step[0].before.tiles) == [1]
+
+
+def test_undo_across_size_and_mode_changes():
+    before = noise((300, 200))
+    layer = Layer("a", before)
+    history = History()
+    edit(history, layer, noise((520, 100), "RGBA", seed=1))
+    edit(history, layer, noise((40, 700), seed=2))
+
+    history.undo()
+    assert (layer.size, layer.tiles.mode) == ((520, 100), "RGBA")
+    history.undo()
+    assert same(layer.img, before)
+    history.redo()
+    history.redo()
+    assert same(layer.img, noise((40, 700), seed=2))
+
+
+def test_undo_restores_ops():
+    layer = Layer("a", noise((100, 100)))
+    history = History()
+    history.add_op([layer], invert_color)
+    history.add_op([layer], to_alpha)
+    assert layer.ops == (invert_color, to_alpha)
+    history.undo()
+    assert layer.ops == (invert_color,)
+    history.redo()
+    assert layer.ops == (invert_color, to_alpha)
+
+
+def test_empty_step_is_not_recorded():
+    layer = Layer("a", noise((100, 100)))
+    history = History()
+    history.add_op([layer], invert_color)
+    history.undo()
+    history.add_op([], invert_color)
+    assert not history.can_undo() and history.can_redo()
+
+
+def test_new_edit_clears_redo():
+    layer = Layer("a", noise((100, 100)))
+    history = History()
+    edit(history, layer, noise((100, 100), seed=1))
+    history.undo()
+    edit(history, layer, noise((100, 100), seed=2))
+    assert not history.can_redo() and history.nbytes == sum(
+        e.before.nbytes for step in history._undo for e in step)
+
+
+def test_oldest_steps_are_dropped_over_budget():
+    layer = Layer("a", noise((512, 512)))
+    history = History(max_bytes=1024 * 1024)
+    for seed in range(1, 5):
+        edit(history, layer, noise((512, 512), seed=seed))
+    assert 0 < len(history._undo) < 4
+    assert history.nbytes <= history.max_bytes
+
+
+def test_forget_drops_a_layers_edits():
+    a, b = Layer("a", noise((100, 100))), Layer("b", noise((100, 100)))
+    history = History()
+    history.add_op([a, b], invert_color)
+    edit(history, a, noise((100, 100), seed=1))
+    history.forget(a)
+    assert [[e.layer for e in step] for step in history._undo] == [[b]]
+
+
+def test_undo_returns_a_file_layer_to_its_file(tmp_path):
+    path = str(tmp_path / "a.png")
+    original = noise((300, 200))
+    original.save(path)
+    layer = FileLayer("a", path)
+    history = History()
+    edit(history, layer, noise((300, 200), seed=1))
+    history.undo()
+    assert layer.tiles is None
+    assert same(layer.img, original)
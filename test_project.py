@@ -0,0 +1,127 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import noise, same
+from logic import Cancelled, FileLayer, Layer, PdfLayer, invert_color, load_pdf_layers
+from project import ProjectError, load_project, save_project
+
+
+def test_layers_round_trip(tmp_path):
+    a = Layer("a", noise((600, 300), "RGBA"), visible=False)
+    b = Layer("b", noise((100, 700)))
+    b.add_op(invert_color)
+    path = str(tmp_path / "p.pms")
+    save_project(path, {"images": [a, b], "pages": []})
+
+    editors = load_project(path)
+    assert list(editors) == ["images", "pages"] and editors["pages"] == []
+    x, y = editors["images"]
+    assert (x.name, x.visible, y.name, y.visible) == ("a", False, "b", True)
+    assert y.ops == (invert_color,)
+    assert same(x.img, a.img) and same(y.img, b.img)
+
+
+def test_sources_are_referenced_and_found_after_a_move(tmp_path):
+    folder = tmp_path / "work"
+    folder.mkdir()
+    src = str(folder / "photo.png")
+    noise((300, 200)).save(src)
+    path = str(folder / "p.pms")
+    save_project(path, {"images": [FileLayer("photo", src)]})
+    assert os.path.getsize(path) < 1024  # No pixels, only the reference
+
+    moved = tmp_path / "moved"
+    shutil.move(str(folder), str(moved))
+    (layer,) = load_project(str(moved / "p.pms"))["images"]
+    assert isinstance(layer, FileLayer) and layer.path == str(moved / "photo.png")
+    assert same(layer.img, noise((300, 200)))
+
+
+def test_missing_source_is_saved_with_its_pixels(tmp_path):
+    src = str(tmp_path / "photo.png")
+    noise((300, 200)).save(src)
+    layer = FileLayer("photo", src)
+    layer.base_tiles()
+    os.remove(src)
+    path = str(tmp_path / "p.pms")
+    save_project(path, {"images": [layer]})
+    (out,) = load_project(path)["images"]
+    assert same(out.img, noise((300, 200)))
+
+
+def test_missing_source_never_decoded_is_an_error(tmp_path):
+    src = str(tmp_path / "photo.png")
+    noise((300, 200)).save(src)
+    layer = FileLayer("photo", src)
+    os.remove(src)
+    path = str(tmp_path / "p.pms")
+    with pytest.raises(ProjectError, match="photo"):
+        save_project(path, {"images": [layer]})
+    assert not os.path.exists(path) and not os.path.exists(path + ".part")
+
+
+def test_edited_layer_with_a_missing_source_loads_from_pixels(tmp_path):
+    src = str(tmp_path / "photo.png")
+    noise((300, 200)).save(src)
+    layer = FileLayer("photo", src)
+    layer.img = noise((300, 200), seed=1)
+    path = str(tmp_path / "p.pms")
+    save_project(path, {"images": [layer]})
+    os.remove(src)
+
+    (out,) = load_project(path)["images"]
+    assert type(out) is Layer and same(out.img, noise((300, 200), seed=1))
+
+
+def test_unedited_layer_with_a_missing_source_is_an_error(tmp_path):
+    src = str(tmp_path / "photo.png")
+    noise((300, 200)).save(src)
+    path = str(tmp_path / "p.pms")
+    save_project(path, {"images": [FileLayer("photo", src)]})
+    os.remove(src)
+    with pytest.raises(ProjectError):
+        load_project(path)
+
+
+def test_pdf_pages_round_trip(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    src = str(tmp_path / "doc.pdf")
+    doc = fitz.open()
+    for i in range(3):
+        doc.new_page().insert_text((72, 72), f"Page {i + 1}")
+    doc.save(src)
+    doc.close()
+
+    pages = load_pdf_layers(src)
+    pages[1].img = noise(pages[1].size)
+    path = str(tmp_path / "p.pms")
+    save_project(path, {"pages": pages})
+
+    out = load_project(path)["pages"]
+    assert [type(l) for l in out] == [PdfLayer] * 3
+    assert [l.page_index for l in out] == [0, 1, 2]
+    assert out[0].source is out[2].source
+    assert out[0].tiles is None and same(out[1].img, pages[1].img)
+
+
+def test_cancelled_save_leaves_the_target(tmp_path):
+    path = str(tmp_path / "p.pms")
+    save_project(path, {"images": [Layer("a", noise((50, 50)))]})
+    before = open(path, "rb").read()
+    with pytest.raises(Cancelled):
+        save_project(path, {"images": [Layer("b", noise((50, 50), seed=1))]}, cancelled=lambda: True)
+    assert open(path, "rb").read() == before
+    assert not os.path.exists(path + ".part")
+
+
+def test_not_a_project(tmp_path):
+    path = tmp_path / "x.pms"
+    path.write_bytes(b"not a project at all")
+    with pytest.raises(ProjectError):
+        load_project(str(path))
+    empty = tmp_path / "empty.pms"
+    empty.write_bytes(b"")
+    with pytest.raises(ProjectError):
+        load_project(str(empty))
@@ -0,0 +1,83 @@
+import gc
+
+import pytest
+from PIL import Image
+
+from conftest import noise, same
+from tiles import TILE_SIZE, TileStore, TiledImage
+
+TILE_BYTES = TILE_SIZE * TILE_SIZE * 3
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Room for one RGB tile, so building any larger image spills
+    return TileStore(max_bytes=TILE_BYTES, spill_dir=tmp_path)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_round_trip(mode):
+    img = noise((600, 300), mode)
+    assert same(TiledImage.from_image(img).to_image(), img)
+
+
+def test_transparent_tiles_are_not_stored():
+    img = Image.new("RGBA", (TILE_SIZE * 2, TILE_SIZE))
+    img.paste(noise((TILE_SIZE, TILE_SIZE), "RGBA"), (TILE_SIZE, 0))
+    tiled = TiledImage.from_image(img)
+    assert tiled.tile(0) is None and tiled.pack(0) is None
+    assert same(tiled.to_image(), img)
+
+
+def test_spilled_tiles_read_back(store):
+    img = noise((TILE_SIZE * 2, TILE_SIZE * 2))
+    tiled = TiledImage.from_image(img, store)
+    assert len(tiled._slots) == 3
+    assert store.resident_bytes <= store.max_bytes
+    assert same(tiled.to_image(), img)
+
+
+def test_patched_shares_spill_slots(store):
+    img = noise((TILE_SIZE * 2, TILE_SIZE))
+    base = TiledImage.from_image(img, store)
+    (slot,) = base._slots.values()
+
+    edit = noise((TILE_SIZE, TILE_SIZE), seed=1)
+    expected = img.copy()
+    expected.paste(edit, (TILE_SIZE, 0))
+    patched = base.patched(base.size, base.mode, {1: TiledImage.from_image(edit, store).pack(0)})
+    assert store._refs[slot] == 2
+
+    del base
+    gc.collect()
+    assert store._refs[slot] == 1
+    assert same(patched.to_image(), expected)
+
+    del patched
+    gc.collect()
+    assert slot not in store._refs and slot in store._free
+
+
+def test_patched_to_another_size_and_mode(store):
+    base = TiledImage.from_image(noise((300, 200)), store)
+    target = TiledImage.from_image(noise((520, 100), "RGBA", seed=2), store)
+    packed = {i: target.pack(i) for i, _ in target.boxes()}
+    out = base.patched(target.size, target.mode, packed)
+    assert (out.size, out.mode) == (target.size, target.mode)
+    assert same(out.to_image(), target.to_image())
+
+
+def test_changed_lists_differing_tiles():
+    img = noise((TILE_SIZE * 3, TILE_SIZE))
+    edited = img.copy()
+    edited.putpixel((TILE_SIZE + 5, 5), (0, 0, 0))
+    assert TiledImage.from_image(img).changed(TiledImage.from_image(edited)) == [1]
+
+
+def test_from_packed_decompresses_on_read():
+    img = noise((300, 300))
+    tiled = TiledImage.from_image(img)
+    packed = {i: memoryview(tiled.pack(i)) for i, _ in tiled.boxes()}
+    out = TiledImage.from_packed(tiled.size, tiled.mode, packed)
+    assert not out._tiles
+    assert same(out.to_image(), img)
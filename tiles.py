@@ -0,0 +1,313 @@
+"""
+Tiled pixel storage for layers.
+
+A ``TiledImage`` keeps its pixels as fixed-size NumPy tiles instead of one
+decoded bitmap. All tiles share one memory budget in ``tile_store``; once it
+is exceeded the least-recently-used tiles are written to a memory-mapped
+spill file and read back when next needed. Fully transparent RGBA tiles
+are not stored at all.
+
+Tiles are never modified once stored, so an array handed out by ``tile()``
+stays valid even if the store spills it afterwards, and images derived with
+``patched()`` share their unchanged tiles, including spilled ones.
+"""
+import itertools
+import math
+import os
+import tempfile
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+TILE_SIZE = 256
+
+_BANDS = {"RGBA": 4, "RGB": 3, "L": 1}
+_SLOT_BYTES = TILE_SIZE * TILE_SIZE * 4
+# Spill slots per memory-mapped segment; segments are sparse files, so unused slots cost nothing
+_SEGMENT_SLOTS = 1024
+
+_ids = itertools.count()
+
+# The one thread pool for packing tiles and decoding or encoding images: zlib and
+# Pillow's codecs release the GIL, so they run on every core
+worker_pool = ThreadPoolExecutor(os.cpu_count() or 1)
+
+
+def storable(img):
+    """The image in a mode TiledImage stores, converting other modes to RGB or RGBA."""
+    if img.mode in _BANDS:
+        return img
+    return img.convert("RGBA" if img.has_transparency_data else "RGB")
+
+
+class TileStore:
+    """
+    Tracks resident tiles across every TiledImage, spilling the least recently
+    used ones to disk once they exceed max_bytes.
+    """
+    def __init__(self, max_bytes=1024 * 1024 * 1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.lock = threading.RLock()
+        self._resident = OrderedDict()  # (owner id, index) -> nbytes
+        self._owners = {}               # owner id -> weakref to TiledImage
+        self._bytes = 0
+        self._segments = []
+        self._free = []
+        self._refs = {}  # spill slot -> number of images sharing it
+
+    @property
+    def resident_bytes(self):
+        return self._bytes
+
+    def register(self, image):
+        self._owners[image.uid] = weakref.ref(image)
+
+    def touch(self, uid, index, nbytes):
+        """Marks a tile as resident and recently used, spilling others if over budget."""
+        key = (uid, index)
+        if key in self._resident:
+            self._resident.move_to_end(key)
+            return
+        self._resident[key] = nbytes
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and len(self._resident) > 1:
+            (owner, idx), size = self._resident.popitem(last=False)
+            self._bytes -= size
+            image = self._owners.get(owner)
+            image = image() if image else None
+            if image is not None:
+                image._spill(idx)
+
+    def discard(self, uid, index):
+        nbytes = self._resident.pop((uid, index), None)
+        if nbytes is not None:
+            self._bytes -= nbytes
+
+    def forget(self, uid, indexes, slots):
+        """Releases everything an image held; called when it is garbage collected."""
+        with self.lock:
+            for index in indexes:
+                self.discard(uid, index)
+            for slot in slots.values():
+                self.release(slot)
+            self._owners.pop(uid, None)
+
+    def share(self, slot):
+        self._refs[slot] += 1
+        return slot
+
+    def release(self, slot):
+        self._refs[slot] -= 1
+        if not self._refs[slot]:
+            del self._refs[slot]
+            self._free.append(slot)
+
+    def write(self, arr):
+        """Copies a tile into a free spill slot and returns the slot."""
+        if not self._free:
+            f = tempfile.TemporaryFile(dir=self.spill_dir)
+            seg = np.memmap(f, dtype=np.uint8, mode="w+", shape=(_SEGMENT_SLOTS, _SLOT_BYTES))
+            base = len(self._segments) * _SEGMENT_SLOTS
+            self._segments.append(seg)
+            self._free.extend(range(base + _SEGMENT_SLOTS - 1, base - 1, -1))
+        slot = self._free.pop()
+        self._slot(slot)[:arr.nbytes] = arr.reshape(-1)
+        self._refs[slot] = 1
+        return slot
+
+    def read(self, slot, shape):
+        return self._slot(slot)[:math.prod(shape)].reshape(shape).copy()
+
+    def _slot(self, slot):
+        return self._segments[slot // _SEGMENT_SLOTS][slot % _SEGMENT_SLOTS]
+
+tile_store = TileStore()
+
+
+class TiledImage:
+    """An immutable RGBA, RGB or L image stored as TILE_SIZE tiles in tile_store."""
+    def __init__(self, size, mode, store=None):
+        if mode not in _BANDS:
+            raise ValueError(f"Unsupported tile mode: {mode}")
+        self.size = size
+        self.mode = mode
+        self.bands = _BANDS[mode]
+        self.cols = -(-size[0] // TILE_SIZE)
+        self.rows = -(-size[1] // TILE_SIZE)
+        self.uid = next(_ids)
+        self.store = store or tile_store
+        self._tiles = {}   # index -> resident array
+        self._slots = {}   # index -> spill slot
+        self._packed = {}  # index -> zlib-compressed tile, see patched()
+        self.store.register(self)
+        weakref.finalize(self, self.store.forget, self.uid, self._tiles, self._slots)
+
+    @classmethod
+    def from_image(cls, img, store=None):
+        """Splits a PIL image into tiles, converting other modes with storable()."""
+        img = storable(img)
+        tiled = cls(img.size, img.mode, store)
+        for index, box in tiled.boxes():
+            tiled._put(index, np.asarray(img.crop(box)))
+        return tiled
+
+    @classmethod
+    def from_packed(cls, size, mode, packed, store=None):
+        """
+        An image made of pack() results ({index: data}), decompressed the
+        first time each tile is read. data may be any buffer, such as a
+        memoryview of a mapped file.
+        """
+        out = cls(size, mode, store)
+        out._packed.update((index, data) for index, data in packed.items() if data is not None)
+        return out
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def boxes(self):
+        """Yields (index, box) for every tile, row by row."""
+        w, h = self.size
+        for row in range(self.rows):
+            for col in range(self.cols):
+                x, y = col * TILE_SIZE, row * TILE_SIZE
+                yield row * self.cols + col, (x, y, min(x + TILE_SIZE, w), min(y + TILE_SIZE, h))
+
+    def _shape(self, index):
+        row, col = divmod(index, self.cols)
+        w = min(TILE_SIZE, self.size[0] - col * TILE_SIZE)
+        h = min(TILE_SIZE, self.size[1] - row * TILE_SIZE)
+        return (h, w) if self.bands == 1 else (h, w, self.bands)
+
+    def _put(self, index, arr):
+        if self.mode == "RGBA" and not arr.any():
+            return  # Missing tiles read back as transparent
+        arr = np.ascontiguousarray(arr, dtype=np.uint8)
+        with self.store.lock:
+            self._tiles[index] = arr
+            self.store.touch(self.uid, index, arr.nbytes)
+
+    def _spill(self, index):
+        # Called by the store, which already holds its lock
+        arr = self._tiles.pop(index, None)
+        # Packed tiles can be decompressed again instead of written out
+        if arr is not None and index not in self._slots and index not in self._packed:
+            self._slots[index] = self.store.write(arr)
+
+    def tile(self, index):
+        """The tile's pixels as an array, or None if it is fully transparent."""
+        with self.store.lock:
+            arr = self._tiles.get(index)
+            if arr is None:
+                if index in self._slots:
+                    arr = self.store.read(self._slots[index], self._shape(index))
+                elif index in self._packed:
+                    data = zlib.decompress(self._packed[index])
+                    arr = np.frombuffer(data, np.uint8).reshape(self._shape(index))
+                else:
+                    return None
+                self._tiles[index] = arr
+            self.store.touch(self.uid, index, arr.nbytes)
+            return arr
+
+    def pack(self, index):
+        """The tile compressed with zlib, or None if it is fully transparent."""
+        data = self._packed.get(index)
+        if data is not None:
+            return data
+        arr = self.tile(index)
+        return None if arr is None else zlib.compress(arr.tobytes(), 1)
+
+    def changed(self, other):
+        """Indexes of the tiles that differ from another image of the same size and mode."""
+        return [i for i, _ in self.boxes() if not _same(self.tile(i), other.tile(i))]
+
+    def patched(self, size, mode, packed):
+        """
+        A new image with the tiles in packed ({index: pack() result}) replaced.
+        They are decompressed the first time they are read; every other tile
+        is shared with this image. If size or mode differ, packed must hold
+        every tile.
+        """
+        out = TiledImage(size, mode, self.store)
+        with self.store.lock:
+            for index, data in packed.items():
+                if data is not None:
+                    out._packed[index] = data
+            if (size, mode) != (self.size, self.mode):
+                return out
+            for index, _ in self.boxes():
+                if index in packed:
+                    continue
+                if index in self._packed:
+                    out._packed[index] = self._packed[index]
+                if index in self._slots:
+                    out._slots[index] = self.store.share(self._slots[index])
+                if index in self._tiles:
+                    out._tiles[index] = self._tiles[index]
+                    self.store.touch(out.uid, index, self._tiles[index].nbytes)
+        return out
+
+    def tile_image(self, index):
+        arr = self.tile(index)
+        if arr is None:
+            return Image.new(self.mode, self._shape(index)[1::-1])
+        return Image.fromarray(arr)
+
+    def regions(self):
+        """Yields (image, (x, y)) for every tile that is not fully transparent."""
+        for index, box in self.boxes():
+            arr = self.tile(index)
+            if arr is not None:
+                yield Image.fromarray(arr), box[:2]
+
+    def to_image(self):
+        """Assembles the full image."""
+        img = Image.new(self.mode, self.size)
+        for tile, pos in self.regions():
+            img.paste(tile, pos)
+        return img
+
+    def map(self, func):
+        """
+        Applies a per-pixel function to each tile and returns the result as a
+        new TiledImage. func takes and returns a PIL image of the same size.
+        """
+        result = None
+        for index, box in self.boxes():
+            out = func(self.tile_image(index))
+            if result is None:
+                result = TiledImage(self.size, out.mode, self.store)
+            elif out.mode != result.mode:
+                out = out.convert(result.mode)
+            result._put(index, np.asarray(out))
+        return result or TiledImage(self.size, self.mode, self.store)
+
+    def reduce(self, factor):
+        """
+        Downscales by an integer box filter, tile by tile. Matches
+        Image.reduce on the full image when factor divides TILE_SIZE.
+        """
+        if factor <= 1:
+            return self.to_image()
+        img = Image.new(self.mode, (-(-self.size[0] // factor), -(-self.size[1] // factor)))
+        for tile, (x, y) in self.regions():
+            img.paste(tile.reduce(factor), (x // factor, y // factor))
+        return img
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    return a is b or np.array_equal(a, b)
@@ -1,108 +1,486 @@
+import weakref
+from collections import OrderedDict
+
 from PyQt6.QtWidgets import (
     QWidget, QHBoxLayout, QLabel, QToolButton, QStyle, QDialog, QVBoxLayout, 
-    QDialogButtonBox, QSizePolicy
+    QDialogButtonBox, QSizePolicy, QProgressBar, QTableWidget, QTableWidgetItem,
+    QHeaderView, QPushButton, QFileDialog, QStyledItemDelegate, QApplication,
+    QComboBox, QSpinBox, QFormLayout, QCheckBox
+)
+from PyQt6.QtCore import (
+    Qt, QSize, QTimer, QRect, QPoint, QEvent, QModelIndex, QAbstractListModel, QMimeData
 )
-from PyQt6.QtCore import Qt, QRect
-from PyQt6.QtGui import QPixmap, QImage, QPainter, QColor
+from PyQt6.QtGui import QPixmap, QImage, QPainter, QColor, QBrush
+
+from logic import ENCODERS, PDF_DPI, ExportSettings, PdfExportSettings
+from profiling import profiler, traced, size_of
+from resultcache import result_cache
+
+# QImage formats that can borrow a PIL image's raw bytes as-is
+_QIMAGE_FORMATS = {
+    "RGBA": QImage.Format.Format_RGBA8888,
+    "RGB": QImage.Format.Format_RGB888,
+    "L": QImage.Format.Format_Grayscale8,
+}
+# Recent conversions: key -> (qimage, buffer, weak reference to the image or None)
+_qimages = OrderedDict()
+_qimage_bytes = 0
+QIMAGE_CACHE_BYTES = 256 * 1024 * 1024
+
+def cached_qimage(key):
+    """The (qimage, buffer) to_qimage cached under key, or None."""
+    hit = _qimages.get(key)
+    if hit is None:
+        return None
+    _qimages.move_to_end(key)
+    return hit[0], hit[1]
+
+def to_qimage(pil_img, key=None, cache=True):
+    """
+    Wraps a PIL image as a QImage with a single copy of its pixels.
+    Returns (qimage, buffer); the QImage borrows buffer, so keep it alive for
+    as long as the QImage is in use. Conversions are cached under key, or by
+    default per image object, so refreshing an unchanged layer doesn't
+    convert it again; the cache holds only the buffers, not the images.
+    cache=False converts a one-off image without caching it.
+    """
+    global _qimage_bytes
+    ref = None
+    if key is None:
+        key, ref = ("image", id(pil_img)), weakref.ref(pil_img)
+    hit = _qimages.get(key)
+    if hit is not None and (hit[2] is None or hit[2]() is pil_img):
+        _qimages.move_to_end(key)
+        return hit[0], hit[1]
+
+    img = pil_img if pil_img.mode in _QIMAGE_FORMATS else pil_img.convert("RGBA")
+    buf = img.tobytes()
+    bpl = img.width * len(img.getbands())
+    qim = QImage(buf, img.width, img.height, bpl, _QIMAGE_FORMATS[img.mode])
+
+    if cache and len(buf) <= QIMAGE_CACHE_BYTES:
+        if hit is not None:
+            _qimage_bytes -= len(hit[1])  # An image that has since been freed
+        _qimages[key] = (qim, buf, ref)
+        _qimages.move_to_end(key)
+        _qimage_bytes += len(buf)
+        while _qimage_bytes > QIMAGE_CACHE_BYTES:
+            _, (_, old, _) = _qimages.popitem(last=False)
+            _qimage_bytes -= len(old)
+    return qim, buf
+
+def checker_brush(size):
+    """A brush painting a checkerboard of size-pixel squares."""
+    tile = QPixmap(size * 2, size * 2)
+    tile.fill(QColor(60, 60, 60))
+    p = QPainter(tile)
+    p.fillRect(size, 0, size, size, QColor(40, 40, 40))
+    p.fillRect(0, size, size, size, QColor(40, 40, 40))
+    p.end()
+    return QBrush(tile)
 
 class CheckerLabel(QLabel):
     """
     Custom Label that draws a checkerboard background and scales the image 
     to fit the available space without forcing the window to expand.
+    Scaled results are cached per widget size and produced from a mip pyramid
+    of the image, with a fast pass while resizing and a smooth one once it stops.
     """
+    CHECKER_SIZE = 20
+    # Quiet time after the last resize before the smooth pass
+    SMOOTH_DELAY_MS = 150
+
     def __init__(self, parent=None):
         super().__init__(parent)
         # IGNORED policy tells the layout: "I don't need a specific size, just give me what you have."
         self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
         self.current_image = None 
+        self._buffer = None
+        self._levels = []
+        self._scaled = None
+        self._scaled_key = None
+        self._checker = checker_brush(self.CHECKER_SIZE)
+        
+        self._resizing = False
+        self._settle = QTimer(self)
+        self._settle.setSingleShot(True)
+        self._settle.setInterval(self.SMOOTH_DELAY_MS)
+        self._settle.timeout.connect(self._end_resize)
 
-    def set_image(self, pil_img):
-        """Converts PIL image to QImage and stores it for painting."""
+    def set_image(self, pil_img, key=None, cache=True):
+        """Converts PIL image to QImage and stores it for painting; see to_qimage for key and cache."""
         if not pil_img:
-            self.current_image = None
+            self._show(None, None)
         else:
-            if pil_img.mode != "RGBA":
-                pil_img = pil_img.convert("RGBA")
-            data = pil_img.tobytes("raw", "RGBA")
-            # Create a copy so we own the data (prevents garbage collection issues)
-            qim = QImage(data, pil_img.width, pil_img.height, QImage.Format.Format_RGBA8888)
-            self.current_image = qim.copy()
-        
+            # Hold the buffer the QImage borrows for as long as we show it
+            self._show(*to_qimage(pil_img, key, cache))
+
+    def show_cached(self, key):
+        """Shows the image to_qimage cached under key. Returns False if there is none."""
+        hit = cached_qimage(key)
+        if hit is None:
+            return False
+        self._show(*hit)
+        return True
+
+    def _show(self, qimage, buffer):
+        if qimage is not None and qimage is self.current_image:
+            return  # Keep the scaled levels of what is already showing
+        self.current_image, self._buffer = qimage, buffer
+        self._levels = []
+        self._scaled_key = None
         self.update() # Trigger a repaint
 
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._resizing = True
+        self._settle.start()
+
+    def _end_resize(self):
+        self._resizing = False
+        self.update()
+
+    def _level_for(self, target):
+        """Smallest pyramid level that is still at least as large as target."""
+        if not self._levels:
+            self._levels = [self.current_image]
+        i = 0
+        while True:
+            level = self._levels[i]
+            half = QSize(level.width() // 2, level.height() // 2)
+            if half.width() < target.width() or half.height() < target.height():
+                return level
+            i += 1
+            if i == len(self._levels):
+                self._levels.append(level.scaled(
+                    half, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation))
+
+    def _scaled_image(self):
+        if not self.current_image or self.current_image.isNull():
+            return None
+        target = self.current_image.size().scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatio)
+        if target.isEmpty():
+            return None
+        
+        mode = (Qt.TransformationMode.FastTransformation if self._resizing
+                else Qt.TransformationMode.SmoothTransformation)
+        key = (target.width(), target.height(), mode)
+        if key != self._scaled_key:
+            src = self._level_for(target)
+            if src.size() != target:
+                src = src.scaled(target, Qt.AspectRatioMode.IgnoreAspectRatio, mode)
+            self._scaled, self._scaled_key = src, key
+        return self._scaled
+
+    @traced("CheckerLabel.paint", cat="paint", meta=lambda self, event: {
+        "image": size_of(self.current_image) if self.current_image else None,
+        "widget": f"{self.width()}x{self.height()}"})
     def paintEvent(self, event):
         painter = QPainter(self)
         
         # 1. Draw Checkerboard Background
-        size = 20
-        c1 = QColor(60, 60, 60)
-        c2 = QColor(40, 40, 40)
-        
-        # Optimize drawing: only draw within the clip region if possible, 
-        # but for simple checkers, looping whole widget is fine for now.
-        for y in range(0, self.height(), size):
-            for x in range(0, self.width(), size):
-                color = c1 if ((x // size) + (y // size)) % 2 == 0 else c2
-                painter.fillRect(x, y, size, size, color)
+        painter.fillRect(self.rect(), self._checker)
         
         # 2. Draw the Image (Centered & Scaled)
-        if self.current_image and not self.current_image.isNull():
-            # Calculate aspect-ratio scaled rect
-            target_rect = QRect(0, 0, self.width(), self.height())
-            scaled_img = self.current_image.scaled(
-                self.size(), 
-                Qt.AspectRatioMode.KeepAspectRatio, 
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            # Center the image
+        scaled_img = self._scaled_image()
+        if scaled_img:
             x = (self.width() - scaled_img.width()) // 2
             y = (self.height() - scaled_img.height()) // 2
-            
             painter.drawImage(x, y, scaled_img)
             
         painter.end()
 
-class LayerWidget(QWidget):
-    """Custom list item widget with visibility and move controls."""
-    def __init__(self, item, callback):
-        super().__init__()
-        self.item = item
+def _thumbnail(layer, version, size):
+    # Runs on a pool thread; QImage, unlike QPixmap, may be built off the GUI thread
+    # thumbnail() works in place, and previews can be shared page renders or drafts
+    img = layer.preview((size, size)).copy()
+    img.thumbnail((size, size))
+    if img.mode not in _QIMAGE_FORMATS:
+        img = img.convert("RGBA")
+    buf = img.tobytes()
+    qim = QImage(buf, img.width, img.height, img.width * len(img.getbands()), _QIMAGE_FORMATS[img.mode])
+    return version, qim.copy()  # Detach from buf
+
+class LayerModel(QAbstractListModel):
+    """
+    The layers of an editor, top of the list first. Thumbnails are rendered
+    on the scheduler only for rows the view asks to paint, and cached per
+    layer version, so edits re-render them and visibility changes don't.
+    """
+    MIME = "application/x-layer-rows"
+    THUMB_SIZE = 36
+    # Concurrent thumbnail jobs; they are small and shouldn't crowd out previews
+    THUMB_THREADS = 2
+
+    def __init__(self, scheduler, parent=None):
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self.layers = []
+        self._thumbs = weakref.WeakKeyDictionary()   # layer -> (version, QImage)
+        self._pending = weakref.WeakKeyDictionary()  # layer -> version being rendered
+        scheduler.set_limit("thumbnails", self.THUMB_THREADS)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.layers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        layer = self.layers[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return layer.name
+        if role == Qt.ItemDataRole.UserRole:
+            return layer
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.thumbnail(layer)
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.ItemIsDropEnabled  # Drops go between rows, never onto one
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsDragEnabled
+
+    def thumbnail(self, layer):
+        """The cached thumbnail, possibly of an older version; queues a render if it is stale."""
+        hit = self._thumbs.get(layer)
+        if (hit is None or hit[0] != layer.version) and self._pending.get(layer) != layer.version:
+            self._pending[layer] = layer.version
+            self.scheduler.submit(
+                _thumbnail, layer, layer.version, self.THUMB_SIZE, key=(self, "thumb", id(layer)),
+                coalesce=True, group="thumbnails", label=f"Thumbnail {layer.name}",
+                on_done=lambda res, layer=layer: self._set_thumbnail(layer, *res))
+        return hit[1] if hit else None
+
+    def _set_thumbnail(self, layer, version, qim):
+        if self._pending.get(layer) == version:
+            del self._pending[layer]
+        self._thumbs[layer] = (version, qim)
+        self.update([layer])
+
+    def update(self, layers):
+        """Repaints the rows of layers whose name, visibility or pixels changed."""
+        for layer in layers:
+            row = self.row(layer)
+            if row >= 0:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+    def row(self, layer):
+        return next((i for i, l in enumerate(self.layers) if l is layer), -1)
+
+    def reset(self, layers):
+        """Replaces every row, e.g. when a project is opened."""
+        self.beginResetModel()
+        self.layers = list(layers)
+        self._thumbs.clear()
+        self._pending.clear()
+        self.endResetModel()
+
+    def append(self, layers):
+        if not layers:
+            return
+        n = len(self.layers)
+        self.beginInsertRows(QModelIndex(), n, n + len(layers) - 1)
+        self.layers.extend(layers)
+        self.endInsertRows()
+
+    def remove(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        layer = self.layers.pop(row)
+        self.endRemoveRows()
+        self._thumbs.pop(layer, None)
+
+    def move(self, row, dest):
+        """Moves a row so it lands at dest; selections and the current row follow it."""
+        if row == dest or not 0 <= dest < len(self.layers):
+            return False
+        # beginMoveRows counts the destination before the row is taken out
+        if not self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), dest + (dest > row)):
+            return False
+        self.layers.insert(dest, self.layers.pop(row))
+        self.endMoveRows()
+        return True
+
+    # Drag and drop reorders rows in place instead of copying and removing them
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [self.MIME]
+
+    def mimeData(self, indexes):
+        data = QMimeData()
+        data.setData(self.MIME, ",".join(str(i.row()) for i in indexes).encode())
+        return data
+
+    def moveRows(self, parent, row, count, dest_parent, dest):
+        # dest is the row to insert before, counted before the rows are taken out
+        for i in range(count):
+            if row < dest:
+                self.move(row, dest - 1)
+            else:
+                self.move(row + i, dest + i)
+        return True
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(self.MIME):
+            return False
+        dest = row if row >= 0 else len(self.layers)
+        moving = [self.layers[int(r)] for r in sorted(set(bytes(data.data(self.MIME)).decode().split(",")), key=int)]
+        for layer in moving:
+            src = self.row(layer)
+            self.move(src, dest - 1 if src < dest else dest)
+            dest = self.row(layer) + 1
+        # Returning False stops the view from also removing the dragged rows
+        return False
+
+class LayerDelegate(QStyledItemDelegate):
+    """
+    Paints a layer row: visibility toggle, thumbnail, name and move arrows.
+    Nothing is a widget, so rows cost nothing until painted; clicks on the
+    toggle and arrows go to callback(action, row).
+    """
+    ROW_HEIGHT = 44
+
+    def __init__(self, callback, parent=None):
+        super().__init__(parent)
         self.callback = callback
+        self._checker = checker_brush(6)
+        self._arrows = None
+
+    def _rects(self, rect):
+        h, thumb = rect.height(), LayerModel.THUMB_SIZE
+        eye = QRect(rect.left() + 4, rect.top(), 24, h)
+        pic = QRect(eye.right() + 4, rect.top() + (h - thumb) // 2, thumb, thumb)
+        down = QRect(rect.right() - 26, rect.top(), 24, h)
+        up = QRect(down.left() - 26, rect.top(), 24, h)
+        name = QRect(pic.right() + 8, rect.top(), up.left() - pic.right() - 12, h)
+        return eye, pic, name, up, down
+
+    def sizeHint(self, option, index):
+        return QSize(200, self.ROW_HEIGHT)
+
+    def paint(self, painter, option, index):
+        layer = index.data(Qt.ItemDataRole.UserRole)
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_PanelItemViewItem, option, painter, option.widget)
+        eye, pic, name, up, down = self._rects(option.rect)
+
+        painter.save()
+        painter.setPen(QColor("#4CAF50" if layer.visible else "#666"))
+        font = painter.font()
+        font.setPixelSize(14)
+        painter.setFont(font)
+        painter.drawText(eye, Qt.AlignmentFlag.AlignCenter, "👁")
+        painter.restore()
+
+        # Checkerboard behind the thumbnail, as in the preview
+        painter.fillRect(pic, QColor(40, 40, 40))
+        thumb = index.data(Qt.ItemDataRole.DecorationRole)
+        if thumb is not None:
+            target = QRect(QPoint(), thumb.size().scaled(pic.size(), Qt.AspectRatioMode.KeepAspectRatio))
+            target.moveCenter(pic.center())
+            painter.fillRect(target, self._checker)
+            painter.drawImage(target, thumb)
+
+        text = option.fontMetrics.elidedText(layer.name, Qt.TextElideMode.ElideRight, name.width())
+        painter.save()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.setPen(option.palette.highlightedText().color())
+        painter.drawText(name, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, text)
+        painter.restore()
+
+        if self._arrows is None:
+            self._arrows = [style.standardIcon(p).pixmap(16, 16) for p in
+                            (QStyle.StandardPixmap.SP_ArrowUp, QStyle.StandardPixmap.SP_ArrowDown)]
+        for rect, pix in zip((up, down), self._arrows):
+            painter.drawPixmap(rect.center().x() - 8, rect.center().y() - 8, pix)
+
+    def editorEvent(self, event, model, option, index):
+        if (event.type() == QEvent.Type.MouseButtonRelease
+                and event.button() == Qt.MouseButton.LeftButton):
+            eye, _, _, up, down = self._rects(option.rect)
+            pos = event.position().toPoint()
+            for rect, action in ((eye, 'vis'), (up, 'up'), (down, 'down')):
+                if rect.contains(pos):
+                    self.callback(action, index.row())
+                    return True
+        return super().editorEvent(event, model, option, index)
+
+class ExportDialog(QDialog):
+    """Picks what to export, as (key, label) scopes, and how to encode it."""
+    def __init__(self, parent, scopes, settings=None):
+        super().__init__(parent)
+        self.setWindowTitle("Export")
+        settings = settings or ExportSettings()
         
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(5, 0, 5, 0)
-        
-        # Visibility Button
-        self.vis_btn = QToolButton()
-        self.vis_btn.setText("👁")
-        self.vis_btn.setCheckable(True)
-        self.vis_btn.setChecked(True)
-        self.vis_btn.setCursor(Qt.CursorShape.PointingHandCursor)
-        self.vis_btn.clicked.connect(lambda c: (self.style_vis(c), callback('vis', item)))
-        self.style_vis(True)
-        
-        # Label
-        self.lbl = QLabel(item.data(Qt.ItemDataRole.UserRole).name)
-        
-        # Move Buttons
-        up = QToolButton()
-        up.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_ArrowUp))
-        up.clicked.connect(lambda: callback('up', item))
-        
-        down = QToolButton()
-        down.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_ArrowDown))
-        down.clicked.connect(lambda: callback('down', item))
-        
-        layout.addWidget(self.vis_btn)
-        layout.addWidget(self.lbl)
-        layout.addStretch(1)
-        layout.addWidget(up)
-        layout.addWidget(down)
+        form = QFormLayout(self)
+        self.scope = QComboBox()
+        for key, label in scopes:
+            self.scope.addItem(label, key)
+        self.encoder = QComboBox()
+        self.encoder.addItems(list(ENCODERS))
+        self.encoder.setCurrentText(settings.encoder)
+        self.quality = QSpinBox(minimum=1, maximum=100, value=settings.quality)
+        self.compression = QSpinBox(minimum=0, maximum=9, value=settings.compression)
+        self.compression.setToolTip("0 is fastest, 9 is smallest")
+        self.encoder.currentTextChanged.connect(self.update_fields)
+        self.update_fields(settings.encoder)
+        
+        form.addRow("Export:", self.scope)
+        form.addRow("Format:", self.encoder)
+        form.addRow("Quality:", self.quality)
+        form.addRow("PNG compression:", self.compression)
+        
+        btns = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        btns.accepted.connect(self.accept)
+        btns.rejected.connect(self.reject)
+        form.addRow(btns)
 
-    def style_vis(self, visible): 
-        color = '#4CAF50' if visible else '#666'
-        self.vis_btn.setStyleSheet(f"color: {color}; border: none; font-size: 14px;")
+    def update_fields(self, encoder):
+        self.quality.setEnabled(encoder.startswith(("JPEG", "WebP")))
+        self.compression.setEnabled(encoder == "PNG")
+
+    def selected_scope(self):
+        return self.scope.currentData()
+
+    def settings(self):
+        return ExportSettings(self.encoder.currentText(), self.quality.value(), self.compression.value())
+
+class PdfExportDialog(QDialog):
+    """Settings for embedding flattened pages in an exported PDF."""
+    def __init__(self, parent, settings=None):
+        super().__init__(parent)
+        self.setWindowTitle("Export PDF")
+        settings = settings or PdfExportSettings()
+        
+        form = QFormLayout(self)
+        self.encoding = QComboBox()
+        self.encoding.addItems(["JPEG", "Flate"])
+        self.encoding.setItemData(1, "Lossless", Qt.ItemDataRole.ToolTipRole)
+        self.encoding.setCurrentText(settings.encoding)
+        self.quality = QSpinBox(minimum=1, maximum=95, value=settings.quality)
+        self.encoding.currentTextChanged.connect(lambda e: self.quality.setEnabled(e == "JPEG"))
+        self.quality.setEnabled(settings.encoding == "JPEG")
+        self.dpi = QSpinBox(minimum=36, maximum=PDF_DPI, value=settings.dpi, suffix=" dpi")
+        self.grayscale = QCheckBox("Store black-and-white pages as grayscale")
+        self.grayscale.setChecked(settings.grayscale)
+        
+        form.addRow("Edited pages as:", self.encoding)
+        form.addRow("JPEG quality:", self.quality)
+        form.addRow("Resolution:", self.dpi)
+        form.addRow(self.grayscale)
+        form.addRow(QLabel("Unedited pages are copied as-is.", styleSheet="color: #999"))
+        
+        btns = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        btns.accepted.connect(self.accept)
+        btns.rejected.connect(self.reject)
+        form.addRow(btns)
+
+    def settings(self):
+        return PdfExportSettings(self.encoding.currentText(), self.quality.value(), self.dpi.value(),
+                                 self.grayscale.isChecked())
 
 class CompareDialog(QDialog):
     """Side-by-side comparison dialog."""
@@ -119,7 +497,7 @@ class CompareDialog(QDialog):
             # Reuse our smart CheckerLabel here too so previews don't break the dialog
             lbl = CheckerLabel()
             lbl.setStyleSheet("border: 1px solid #555;")
-            lbl.set_image(img)
+            lbl.set_image(img, cache=False)  # Full size and shown once
             
             v_box.addWidget(QLabel(txt, alignment=Qt.AlignmentFlag.AlignCenter))
             v_box.addWidget(lbl)
@@ -130,4 +508,109 @@ class CompareDialog(QDialog):
         btns = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         btns.accepted.connect(self.accept)
         btns.rejected.connect(self.reject)
-        layout.addWidget(btns)
\ No newline at end of file
+        layout.addWidget(btns)
+
+class JobStatus(QWidget):
+    """Status bar summary of a JobScheduler's jobs, with a cancel button."""
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+        
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.lbl = QLabel()
+        self.bar = QProgressBar()
+        self.bar.setFixedWidth(180)
+        self.bar.setTextVisible(False)
+        cancel = QToolButton()
+        cancel.setText("Cancel")
+        cancel.clicked.connect(scheduler.cancel_all)
+        
+        layout.addWidget(self.lbl)
+        layout.addWidget(self.bar)
+        layout.addWidget(cancel)
+        
+        scheduler.changed.connect(self.update_status)
+        self.hide()
+
+    def update_status(self):
+        jobs = self.scheduler.jobs
+        if not jobs:
+            self.hide()
+            return
+        
+        running = [j for j in jobs if j.running]
+        text = (running or jobs)[0].label
+        if len(jobs) > 1:
+            text += f"  (+{len(jobs) - 1} more)"
+        self.lbl.setText(text)
+        
+        # Finished jobs count as whole steps, running ones by their reported progress
+        total = self.scheduler.completed + len(jobs)
+        partial = sum(j.done / j.total for j in running if j.total)
+        self.bar.setRange(0, total * 100)
+        self.bar.setValue(int((self.scheduler.completed + partial) * 100))
+        self.show()
+
+class StatsPanel(QWidget):
+    """Live per-operation timings from the profiler, with trace export."""
+    COLUMNS = ["Operation", "Calls", "Total ms", "Mean ms", "Max ms", "Last ms"]
+    REFRESH_MS = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+        self.cache_lbl = QLabel()
+        self.cache_lbl.setWordWrap(True)
+        layout.addWidget(self.cache_lbl)
+        
+        btns = QHBoxLayout()
+        reset = QPushButton("Reset")
+        reset.clicked.connect(self.reset)
+        export = QPushButton("Export Trace...")
+        export.clicked.connect(self.export_trace)
+        btns.addWidget(reset)
+        btns.addWidget(export)
+        layout.addLayout(btns)
+        
+        # Only poll while the panel is on screen
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.REFRESH_MS)
+        self.timer.timeout.connect(self.update_stats)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_stats()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def update_stats(self):
+        rows = profiler.snapshot()
+        self.table.setRowCount(len(rows))
+        for r, (name, s) in enumerate(rows):
+            values = [name, str(s.calls)] + [f"{v * 1e3:.1f}" for v in (s.total, s.mean, s.max, s.last)]
+            for c, v in enumerate(values):
+                item = QTableWidgetItem(v)
+                if c:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(r, c, item)
+        self.cache_lbl.setText(f"Result cache: {result_cache.summary()}")
+
+    def reset(self):
+        profiler.reset()
+        self.update_stats()
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "trace.json", "*.json")
+        if path:
+            profiler.export_chrome_trace(path)